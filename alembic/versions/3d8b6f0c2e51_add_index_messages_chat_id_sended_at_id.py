@@ -0,0 +1,41 @@
+"""add index messages chat_id sended_at id
+
+Revision ID: 3d8b6f0c2e51
+Revises: 9c2f4e7a1b3d
+Create Date: 2026-10-18 13:22:09.574113
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3d8b6f0c2e51'
+down_revision: Union[str, None] = '9c2f4e7a1b3d'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # CREATE INDEX CONCURRENTLY не работает внутри транзакции, зато не блокирует запись в таблицу
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_messages_chat_id_sended_at_id',
+            'messages',
+            ['chat_id', 'sended_at', 'id'],
+            unique=False,
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            'ix_messages_chat_id_sended_at_id',
+            table_name='messages',
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
@@ -0,0 +1,98 @@
+"""partition messages by month
+
+Revision ID: 7f31d9e2a6c4
+Revises: e5a0c3f86d27
+Create Date: 2026-10-18 16:37:52.208815
+
+"""
+from typing import Sequence, Union
+from datetime import date, datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7f31d9e2a6c4'
+down_revision: Union[str, None] = 'e5a0c3f86d27'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# сколько месяцев вперед создать секции сразу; дальше их создает фоновая задача приложения
+MONTHS_AHEAD = 3
+
+
+def _next_month(day: date) -> date:
+    return date(day.year + day.month // 12, day.month % 12 + 1, 1)
+
+
+def upgrade() -> None:
+    op.execute('ALTER TABLE messages RENAME TO messages_unpartitioned')
+    op.execute('ALTER TABLE messages_unpartitioned RENAME CONSTRAINT messages_pkey TO messages_unpartitioned_pkey')
+    op.drop_index('ix_messages_chat_id_id', table_name='messages_unpartitioned')
+    op.drop_index('ix_messages_chat_id_sended_at_id', table_name='messages_unpartitioned')
+
+    op.execute("""
+        CREATE TABLE messages (
+            id INTEGER NOT NULL DEFAULT nextval('messages_id_seq'),
+            author_username VARCHAR(24) NOT NULL REFERENCES users (username),
+            content VARCHAR(512) NOT NULL,
+            sended_at TIMESTAMP WITHOUT TIME ZONE NOT NULL DEFAULT now(),
+            chat_id INTEGER NOT NULL REFERENCES user_chats (id),
+            PRIMARY KEY (id, sended_at)
+        ) PARTITION BY RANGE (sended_at)
+    """)
+
+    oldest = op.get_bind().execute(sa.text('SELECT min(sended_at) FROM messages_unpartitioned')).scalar()
+    today = datetime.now().date()
+    month = date((oldest or today).year, (oldest or today).month, 1)
+    last = today
+    for _ in range(MONTHS_AHEAD):
+        last = _next_month(last)
+    while month <= last:
+        upper = _next_month(month)
+        op.execute(
+            f"CREATE TABLE messages_{month.year}_{month.month:02d} PARTITION OF messages "
+            f"FOR VALUES FROM ('{month.isoformat()}') TO ('{upper.isoformat()}')"
+        )
+        month = upper
+
+    op.create_index('ix_messages_chat_id_id', 'messages', ['chat_id', 'id'], unique=False)
+    op.create_index('ix_messages_chat_id_sended_at_id', 'messages', ['chat_id', 'sended_at', 'id'], unique=False)
+
+    op.execute("""
+        INSERT INTO messages (id, author_username, content, sended_at, chat_id)
+        SELECT id, author_username, content, COALESCE(sended_at, now()), chat_id
+        FROM messages_unpartitioned
+    """)
+    op.execute('ALTER SEQUENCE messages_id_seq OWNED BY messages.id')
+    op.drop_table('messages_unpartitioned')
+
+
+def downgrade() -> None:
+    op.execute('ALTER TABLE messages RENAME TO messages_partitioned')
+    op.execute('ALTER TABLE messages_partitioned RENAME CONSTRAINT messages_pkey TO messages_partitioned_pkey')
+    op.drop_index('ix_messages_chat_id_id', table_name='messages_partitioned')
+    op.drop_index('ix_messages_chat_id_sended_at_id', table_name='messages_partitioned')
+
+    op.execute("""
+        CREATE TABLE messages (
+            id INTEGER NOT NULL DEFAULT nextval('messages_id_seq'),
+            author_username VARCHAR(24) NOT NULL REFERENCES users (username),
+            content VARCHAR(512) NOT NULL,
+            sended_at TIMESTAMP WITHOUT TIME ZONE DEFAULT now(),
+            chat_id INTEGER NOT NULL REFERENCES user_chats (id),
+            PRIMARY KEY (id)
+        )
+    """)
+    op.create_index('ix_messages_chat_id_id', 'messages', ['chat_id', 'id'], unique=False)
+    op.create_index('ix_messages_chat_id_sended_at_id', 'messages', ['chat_id', 'sended_at', 'id'], unique=False)
+
+    op.execute("""
+        INSERT INTO messages (id, author_username, content, sended_at, chat_id)
+        SELECT id, author_username, content, sended_at, chat_id
+        FROM messages_partitioned
+    """)
+    op.execute('ALTER SEQUENCE messages_id_seq OWNED BY messages.id')
+    # секции удаляются вместе с родительской таблицей
+    op.drop_table('messages_partitioned')
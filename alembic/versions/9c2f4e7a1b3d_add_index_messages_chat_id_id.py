@@ -0,0 +1,26 @@
+"""add index messages chat_id id
+
+Revision ID: 9c2f4e7a1b3d
+Revises: be262660939c
+Create Date: 2026-10-18 12:04:31.118402
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9c2f4e7a1b3d'
+down_revision: Union[str, None] = 'be262660939c'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_messages_chat_id_id', 'messages', ['chat_id', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_messages_chat_id_id', table_name='messages')
@@ -0,0 +1,35 @@
+"""add messages search vector
+
+Revision ID: a91f6d2c4e08
+Revises: c82d5b1f47e9
+Create Date: 2026-10-18 19:40:12.508113
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a91f6d2c4e08'
+down_revision: Union[str, None] = 'c82d5b1f47e9'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # колонка и индекс на секционированной таблице распространяются на все секции
+    op.add_column('messages', sa.Column(
+        'search_vector',
+        postgresql.TSVECTOR(),
+        sa.Computed("to_tsvector('russian', content)", persisted=True),
+        nullable=True,
+    ))
+    op.create_index('ix_messages_search_vector', 'messages', ['search_vector'], unique=False, postgresql_using='gin')
+
+
+def downgrade() -> None:
+    op.drop_index('ix_messages_search_vector', table_name='messages')
+    op.drop_column('messages', 'search_vector')
@@ -0,0 +1,65 @@
+"""add chat_participants table
+
+Revision ID: b47e1a9d05c8
+Revises: 3d8b6f0c2e51
+Create Date: 2026-10-18 14:10:47.902361
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b47e1a9d05c8'
+down_revision: Union[str, None] = '3d8b6f0c2e51'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'chat_participants',
+        sa.Column('chat_id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['chat_id'], ['user_chats.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('chat_id', 'user_id'),
+    )
+    op.create_index('ix_chat_participants_user_id_chat_id', 'chat_participants', ['user_id', 'chat_id'], unique=False)
+
+    # перенос участников из json: в старых записях собеседник мог лежать под ключом companion_user
+    op.execute("""
+        INSERT INTO chat_participants (chat_id, user_id)
+        SELECT user_chats.id, users.id
+        FROM user_chats
+        CROSS JOIN LATERAL (VALUES
+            (user_chats.participants ->> 'auth_user'),
+            (COALESCE(user_chats.participants ->> 'companion', user_chats.participants ->> 'companion_user'))
+        ) AS participant(username)
+        JOIN users ON users.username = participant.username
+        ON CONFLICT DO NOTHING
+    """)
+
+    op.drop_column('user_chats', 'participants')
+
+
+def downgrade() -> None:
+    op.add_column('user_chats', sa.Column('participants', postgresql.JSON(astext_type=sa.Text()), autoincrement=False, nullable=True))
+
+    op.execute("""
+        UPDATE user_chats
+        SET participants = json_build_object('auth_user', members.usernames[1], 'companion', members.usernames[array_upper(members.usernames, 1)])
+        FROM (
+            SELECT chat_participants.chat_id, array_agg(users.username ORDER BY users.id) AS usernames
+            FROM chat_participants
+            JOIN users ON users.id = chat_participants.user_id
+            GROUP BY chat_participants.chat_id
+        ) AS members
+        WHERE members.chat_id = user_chats.id
+    """)
+
+    op.drop_index('ix_chat_participants_user_id_chat_id', table_name='chat_participants')
+    op.drop_table('chat_participants')
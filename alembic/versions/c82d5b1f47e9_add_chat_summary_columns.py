@@ -0,0 +1,57 @@
+"""add chat summary columns
+
+Revision ID: c82d5b1f47e9
+Revises: 7f31d9e2a6c4
+Create Date: 2026-10-18 18:15:03.671290
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c82d5b1f47e9'
+down_revision: Union[str, None] = '7f31d9e2a6c4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('user_chats', sa.Column('last_message_id', sa.Integer(), nullable=True))
+    op.add_column('user_chats', sa.Column('last_message_preview', sa.String(length=100), nullable=True))
+    op.add_column('chat_participants', sa.Column('last_message_time', sa.TIMESTAMP(), server_default=sa.text('now()'), nullable=False))
+
+    op.execute("""
+        UPDATE user_chats
+        SET last_message_id = latest.id,
+            last_message_time = latest.sended_at,
+            last_message_preview = left(latest.content, 100)
+        FROM (
+            SELECT DISTINCT ON (chat_id) chat_id, id, sended_at, content
+            FROM messages
+            ORDER BY chat_id, sended_at DESC, id DESC
+        ) AS latest
+        WHERE latest.chat_id = user_chats.id
+    """)
+    op.execute("""
+        UPDATE chat_participants
+        SET last_message_time = user_chats.last_message_time
+        FROM user_chats
+        WHERE user_chats.id = chat_participants.chat_id AND user_chats.last_message_time IS NOT NULL
+    """)
+
+    op.create_index(
+        'ix_chat_participants_user_id_last_message_time',
+        'chat_participants',
+        ['user_id', sa.text('last_message_time DESC')],
+        unique=False,
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_chat_participants_user_id_last_message_time', table_name='chat_participants')
+    op.drop_column('chat_participants', 'last_message_time')
+    op.drop_column('user_chats', 'last_message_preview')
+    op.drop_column('user_chats', 'last_message_id')
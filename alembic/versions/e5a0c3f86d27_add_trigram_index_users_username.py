@@ -0,0 +1,38 @@
+"""add trigram index users username
+
+Revision ID: e5a0c3f86d27
+Revises: b47e1a9d05c8
+Create Date: 2026-10-18 15:02:36.440918
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e5a0c3f86d27'
+down_revision: Union[str, None] = 'b47e1a9d05c8'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_users_username_trgm',
+            'users',
+            ['username'],
+            unique=False,
+            postgresql_using='gin',
+            postgresql_ops={'username': 'gin_trgm_ops'},
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_users_username_trgm', table_name='users', postgresql_concurrently=True, if_exists=True)
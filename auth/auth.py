@@ -3,6 +3,7 @@ from fastapi.responses import JSONResponse
 from fastapi.security import HTTPBearer
 
 from auth.helpers import create_access_token, create_refresh_token
+from auth.utils import verified_token_cache
 from auth.validation import (
     get_current_access_token_payload,
     get_current_auth_user_for_refresh,
@@ -78,6 +79,12 @@ async def auth_user_check_self_info(
         "logged_in_at": iat,
     }
 
+@router.get('/token-cache/')
+async def token_cache_stats(payload: dict = Depends(get_current_access_token_payload)):
+    '''счетчики кэша проверенных токенов для мониторинга'''
+    return verified_token_cache.stats()
+
+
 @router.post('/logout')
 async def logout(response: Response):
     '''удаление токена из куки и перенаправление на главную страницу'''
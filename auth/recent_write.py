@@ -0,0 +1,96 @@
+'''чтение своих записей: после записи пользователь какое-то время читает с primary, реплика может отставать'''
+from typing import AsyncGenerator, Dict
+import hashlib
+import hmac
+import math
+import time
+
+from cryptography.hazmat.primitives import serialization
+from fastapi import Cookie, Response
+from jwt import InvalidTokenError
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from auth.utils import decode_jwt, key_manager
+from config import db_settings
+from database.database import async_read_session_maker, async_session_maker
+
+
+RECENT_WRITE_COOKIE = "recent_write"
+
+# username -> момент (time.monotonic), до которого его чтения идут в primary.
+# Это подсказка только для своего воркера (например, для чтений в том же вебсокете);
+# остальные воркеры узнают об окне из подписанной куки recent_write
+_recent_writes: Dict[str, float] = {}
+
+
+def marker_key() -> bytes:
+    '''ключ hmac для куки: выводится из ключа подписи jwt, поэтому одинаков во всех воркерах'''
+    der = key_manager.private_key.private_bytes(
+        serialization.Encoding.DER, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+    )
+    return hashlib.sha256(b"recent_write:" + der).digest()
+
+
+_marker_key = marker_key()
+
+
+def marker_signature(username: str, expires_ms: int) -> str:
+    return hmac.new(_marker_key, f"{username}:{expires_ms}".encode("utf-8"), hashlib.sha256).hexdigest()
+
+
+def mark_recent_write(username: str) -> str:
+    '''отмечает запись пользователя и возвращает значение куки recent_write: "<истекает, мс>.<hmac>".
+    На каждое сообщение подписывать jwt дорого (rsa - доли миллисекунды в event loop), hmac - микросекунды'''
+    now = time.monotonic()
+    if len(_recent_writes) > 10000:
+        for key, until in list(_recent_writes.items()):
+            if until <= now:
+                del _recent_writes[key]
+    _recent_writes[username] = now + db_settings.db_read_your_writes_seconds
+
+    expires_ms = int((time.time() + db_settings.db_read_your_writes_seconds) * 1000)
+    return f"{expires_ms}.{marker_signature(username, expires_ms)}"
+
+
+def set_recent_write_cookie(response: Response, token: str):
+    response.set_cookie(
+        key=RECENT_WRITE_COOKIE,
+        value=token,
+        httponly=False,
+        secure=False,
+        samesite="Lax",
+        max_age=math.ceil(db_settings.db_read_your_writes_seconds),
+    )
+
+
+def has_recent_write_token(username: str, token: str | None) -> bool:
+    if not token:
+        return False
+    expires, _, signature = token.partition(".")
+    if not expires.isdigit() or int(expires) <= time.time() * 1000:
+        return False
+    return hmac.compare_digest(signature, marker_signature(username, int(expires)))
+
+
+def read_session_maker_for(username: str | None, recent_write: str | None = None) -> async_sessionmaker:
+    if username is not None and (
+        _recent_writes.get(username, 0) > time.monotonic() or has_recent_write_token(username, recent_write)
+    ):
+        return async_session_maker
+    return async_read_session_maker
+
+
+async def get_read_session(
+    access_token: str | None = Cookie(None),
+    recent_write: str | None = Cookie(None),
+) -> AsyncGenerator[AsyncSession, None]:
+    '''сессия для чтения с реплики (или с primary сразу после записи этого пользователя)'''
+    username = None
+    if access_token:
+        try:
+            username = decode_jwt(token=access_token).get("sub")
+        except InvalidTokenError:
+            pass
+
+    async with read_session_maker_for(username, recent_write)() as session:
+        yield session
@@ -1,14 +1,113 @@
 import jwt
 import bcrypt
 import uuid
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec, ed25519, rsa
+from cryptography.hazmat.primitives.asymmetric.types import PrivateKeyTypes, PublicKeyTypes
 from config import settings
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import timedelta, datetime, timezone
+from pathlib import Path
+from typing import Callable, TypeVar
+import asyncio
+import hashlib
+import time
+
+
+T = TypeVar("T")
+
+
+def key_algorithm(public_key: PublicKeyTypes) -> str:
+    '''алгоритм подписи по типу ключа'''
+    if isinstance(public_key, rsa.RSAPublicKey):
+        return "RS256"
+    if isinstance(public_key, ec.EllipticCurvePublicKey) and isinstance(public_key.curve, ec.SECP256R1):
+        return "ES256"
+    if isinstance(public_key, ed25519.Ed25519PublicKey):
+        return "EdDSA"
+    raise ValueError(f"Неподдерживаемый тип ключа jwt: {type(public_key).__name__}")
+
+
+class JWTKey:
+    '''ключ из связки; kid - отпечаток публичного ключа, поэтому одинаков во всех воркерах'''
+
+    def __init__(self, public_key: PublicKeyTypes, private_key: PrivateKeyTypes | None = None, algorithm: str | None = None):
+        self.public_key = public_key
+        self.private_key = private_key
+        self.algorithm = algorithm or key_algorithm(public_key)
+        der = public_key.public_bytes(serialization.Encoding.DER, serialization.PublicFormat.SubjectPublicKeyInfo)
+        self.kid = hashlib.sha256(der).hexdigest()[:16]
+
+
+class JWTKeyManager:
+    '''связка ключей jwt. PEM читаются и разбираются один раз: PyJWT принимает готовые объекты cryptography.
+    Подписывает текущий ключ, проверка выбирает ключ по kid из заголовка - старые ключи
+    остаются в связке на время ротации, чтобы выданные ими токены продолжали работать'''
+
+    def __init__(
+        self,
+        private_key_path: Path = settings.auth_jwt.private_key_path,
+        public_key_path: Path = settings.auth_jwt.public_key_path,
+        algorithm: str | None = settings.auth_jwt.algorithm,
+        previous_public_key_paths: list[Path] = settings.auth_jwt.previous_public_key_paths,
+    ):
+        self.signing_key = JWTKey(
+            serialization.load_pem_public_key(public_key_path.read_bytes()),
+            serialization.load_pem_private_key(private_key_path.read_bytes(), password=None),
+            algorithm,
+        )
+        self.keys = {self.signing_key.kid: self.signing_key}
+        for path in previous_public_key_paths:
+            key = JWTKey(serialization.load_pem_public_key(path.read_bytes()))
+            self.keys.setdefault(key.kid, key)
+
+    @property
+    def algorithm(self) -> str:
+        return self.signing_key.algorithm
+
+    @property
+    def private_key(self) -> PrivateKeyTypes:
+        return self.signing_key.private_key
+
+    @property
+    def public_key(self) -> PublicKeyTypes:
+        return self.signing_key.public_key
+
+    def encode(self, payload: dict) -> str:
+        return jwt.encode(
+            payload, self.signing_key.private_key, algorithm=self.algorithm, headers={"kid": self.signing_key.kid}
+        )
+
+    def decode(self, token: str | bytes) -> dict:
+        header = jwt.get_unverified_header(token)
+        kid = header.get("kid")
+        if kid is not None:
+            if kid not in self.keys:
+                raise jwt.InvalidTokenError("Неизвестный kid")
+            candidates = [self.keys[kid]]
+        else:
+            # токены, выданные до появления kid: перебираем ключи с тем же алгоритмом, текущий первым
+            candidates = [key for key in self.keys.values() if key.algorithm == header.get("alg")]
+            if not candidates:
+                raise jwt.InvalidAlgorithmError("Алгоритм токена не поддерживается")
+
+        for key in candidates[:-1]:
+            try:
+                return jwt.decode(token, key.public_key, algorithms=[key.algorithm])
+            except jwt.InvalidSignatureError:
+                continue
+        # алгоритм ограничен алгоритмом ключа, а не взят из заголовка токена
+        return jwt.decode(token, candidates[-1].public_key, algorithms=[candidates[-1].algorithm])
+
+
+key_manager = JWTKeyManager()
 
 
 def encode_jwt(
     payload: dict,
-    private_key: str = settings.auth_jwt.private_key_path.read_text(),
-    algorithm: str = settings.auth_jwt.algorithm,
+    private_key: PrivateKeyTypes | str | None = None,
+    algorithm: str | None = None,
     expire_timedelta: timedelta | None = None,
     expire_minutes: int = settings.auth_jwt.access_token_expire_minutes,
 ):
@@ -19,38 +118,180 @@ def encode_jwt(
     else:
         expire = now + timedelta(minutes=expire_minutes)
     to_encode.update(exp=expire, iat=now, jti=str(uuid.uuid4()))
-    encoded = jwt.encode(to_encode, private_key, algorithm=algorithm)
+    if private_key is None:
+        return key_manager.encode(to_encode)
+    encoded = jwt.encode(to_encode, private_key, algorithm=algorithm or key_manager.algorithm)
     return encoded
 
 
+class VerifiedTokenCache:
+    '''LRU проверенных токенов: ключ - sha256 токена, запись живет до exp из payload'''
+
+    def __init__(self, max_size: int = settings.auth_jwt.verified_token_cache_size):
+        self.max_size = max_size
+        self.entries: OrderedDict[bytes, dict] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(token: str | bytes) -> bytes:
+        if isinstance(token, str):
+            token = token.encode('utf-8')
+        return hashlib.sha256(token).digest()
+
+    def get(self, token: str | bytes) -> dict | None:
+        key = self.key(token)
+        payload = self.entries.get(key)
+        if payload is not None and payload["exp"] > time.time():
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return dict(payload)
+        if payload is not None:
+            del self.entries[key]
+        self.misses += 1
+        return None
+
+    def put(self, token: str | bytes, payload: dict):
+        # без exp запись нечем ограничить по времени
+        if self.max_size <= 0 or not isinstance(payload.get("exp"), (int, float)):
+            return
+        key = self.key(token)
+        self.entries[key] = dict(payload)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        self.entries.clear()
+
+    def stats(self) -> dict:
+        return {"size": len(self.entries), "max_size": self.max_size, "hits": self.hits, "misses": self.misses}
+
+
+verified_token_cache = VerifiedTokenCache()
+
+
 def decode_jwt(
     token: str | bytes,
-    public_key: str = settings.auth_jwt.public_key_path.read_text(),
-    algorithm: str = settings.auth_jwt.algorithm,
+    public_key: PublicKeyTypes | str | None = None,
+    algorithm: str | None = None,
 ):
-    decoded = jwt.decode(token, public_key, algorithms=[algorithm])
+    # кэш только для связки ключей по умолчанию: с другим ключом тот же токен мог бы не пройти проверку
+    use_cache = public_key is None
+    if use_cache and (payload := verified_token_cache.get(token)) is not None:
+        return payload
+
+    if public_key is None:
+        decoded = key_manager.decode(token)
+    else:
+        decoded = jwt.decode(token, public_key, algorithms=[algorithm or key_manager.algorithm])
+    if use_cache:
+        verified_token_cache.put(token, decoded)
     return decoded
 
 
 def decode_jwt_ws(
     token: str,
-    public_key: str = settings.auth_jwt.public_key_path.read_text(),
-    algorithm: str = settings.auth_jwt.algorithm,
+    public_key: PublicKeyTypes | str | None = None,
+    algorithm: str | None = None,
 ):
     try:
-        return jwt.decode(token, public_key, algorithms=[algorithm])
+        return decode_jwt(token, public_key, algorithm)
     except jwt.ExpiredSignatureError:
         raise ValueError("Токен просрочен")
-    except jwt.JWTError:
+    except jwt.InvalidTokenError:
         raise ValueError("Невалидный токен")
 
 
 
+ARGON2_PREFIX = b"$argon2id$"
+
+
+def argon2_hasher():
+    # argon2-cffi необязателен и нужен только при scheme = "argon2id" или для старых argon2-хэшей
+    from argon2 import PasswordHasher as Argon2Hasher
+
+    return Argon2Hasher(
+        time_cost=settings.password.argon2_time_cost,
+        memory_cost=settings.password.argon2_memory_cost,
+        parallelism=settings.password.argon2_parallelism,
+    )
+
+
+def check_password_scheme():
+    '''вызывается при старте: без argon2-cffi каждый вход со scheme = "argon2id" падал бы с 500'''
+    if settings.password.scheme == "argon2id":
+        try:
+            import argon2
+        except ImportError as e:
+            raise RuntimeError('password.scheme = "argon2id" требует пакет argon2-cffi') from e
+
+
 def hash_password(password: str) -> bytes:
-    salt = bcrypt.gensalt()
     pwd_bytes: bytes = password.encode('utf-8')
+    if settings.password.scheme == "argon2id":
+        return argon2_hasher().hash(pwd_bytes).encode('utf-8')
+    salt = bcrypt.gensalt(rounds=settings.password.bcrypt_rounds)
     return bcrypt.hashpw(pwd_bytes, salt)
 
 
 def validate_password(password: str, hashed_password: bytes) -> bool:
-    return bcrypt.checkpw(password=password.encode('utf-8'), hashed_password=hashed_password)
\ No newline at end of file
+    if hashed_password.startswith(ARGON2_PREFIX):
+        from argon2.exceptions import VerificationError, InvalidHashError
+
+        try:
+            return argon2_hasher().verify(hashed_password, password.encode('utf-8'))
+        except (VerificationError, InvalidHashError):
+            return False
+    return bcrypt.checkpw(password=password.encode('utf-8'), hashed_password=hashed_password)
+
+
+def password_needs_rehash(hashed_password: bytes) -> bool:
+    '''хэш сделан другой схемой или с другими параметрами, чем задано в настройках'''
+    if settings.password.scheme == "argon2id":
+        if not hashed_password.startswith(ARGON2_PREFIX):
+            return True
+        return argon2_hasher().check_needs_rehash(hashed_password.decode('utf-8'))
+    if hashed_password.startswith(ARGON2_PREFIX):
+        return True
+    # bcrypt: $2b$<rounds>$<соль и хэш>
+    return int(hashed_password.split(b"$")[2]) != settings.password.bcrypt_rounds
+
+
+class PasswordHasherBusy(Exception):
+    '''все потоки заняты и очередь ожидания заполнена'''
+
+
+class PasswordHasher:
+    '''выполняет хэширование паролей в ограниченном пуле потоков (bcrypt и argon2 отпускают GIL), не блокируя event loop'''
+
+    def __init__(self, workers: int = settings.password.hash_workers, queue_size: int = settings.password.hash_queue_size):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="password-hasher")
+        self.max_pending = workers + queue_size
+        self.pending = 0
+
+    async def run(self, func: Callable[..., T], *args) -> T:
+        if self.pending >= self.max_pending:
+            raise PasswordHasherBusy()
+        self.pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+        finally:
+            self.pending -= 1
+
+    async def hash(self, password: str) -> bytes:
+        return await self.run(hash_password, password)
+
+    async def validate(self, password: str, hashed_password: bytes) -> bool:
+        return await self.run(validate_password, password, hashed_password)
+
+
+password_hasher = PasswordHasher()
+
+
+async def hash_password_async(password: str) -> bytes:
+    return await password_hasher.hash(password)
+
+
+async def validate_password_async(password: str, hashed_password: bytes) -> bool:
+    return await password_hasher.validate(password, hashed_password)
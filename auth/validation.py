@@ -6,7 +6,7 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 
 from auth.helpers import TOKEN_TYPE_FIELD, ACCESS_TOKEN_TYPE, REFRESH_TOKEN_TYPE
-from auth.utils import decode_jwt, validate_password
+from auth.utils import PasswordHasherBusy, decode_jwt, hash_password_async, password_needs_rehash, validate_password_async
 from auth.schemas import UserSchema
 from database.models import User
 from database.database import get_async_session
@@ -100,10 +100,19 @@ async def validate_auth_user_db(username: str = Form(...), password: str = Form(
     if not user:
         raise unauthed_exc
     
-    if not validate_password(password=password, hashed_password=user.password.encode('utf-8')):
+    if not await validate_password_async(password=password, hashed_password=user.password.encode('utf-8')):
         raise unauthed_exc
 
     if not user.active:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Пользователь неактивен")
+
+    # пароль известен только в момент входа - тогда и переводим хэш на текущие параметры
+    if password_needs_rehash(user.password.encode('utf-8')):
+        try:
+            user.password = (await hash_password_async(password)).decode('utf-8')
+        except PasswordHasherBusy:
+            pass
+        else:
+            await db.commit()
     
     return UserSchema.from_attributes(user)
\ No newline at end of file
@@ -0,0 +1,113 @@
+from config import settings
+from database.database import asyncpg_dsn
+
+from abc import ABC, abstractmethod
+from typing import Awaitable, Callable, List, Set
+import asyncio
+import json
+import logging
+
+logger = logging.Logger(__name__)
+
+MessageHandler = Callable[[int, str], Awaitable[None]]
+
+
+class BroadcastBackend(ABC):
+    '''шина между воркерами: publish доставляет сообщение обработчикам всех процессов, вызвавших start'''
+
+    @abstractmethod
+    async def start(self, on_message: MessageHandler): ...
+
+    @abstractmethod
+    async def stop(self): ...
+
+    @abstractmethod
+    async def publish(self, chat_id: int, message: str): ...
+
+
+class InProcessBackend(BroadcastBackend):
+    '''доставка внутри одного процесса (один воркер uvicorn)'''
+
+    def __init__(self):
+        self.handlers: List[MessageHandler] = []
+
+    async def start(self, on_message: MessageHandler):
+        self.handlers.append(on_message)
+
+    async def stop(self):
+        self.handlers.clear()
+
+    async def publish(self, chat_id: int, message: str):
+        for handler in list(self.handlers):
+            await handler(chat_id, message)
+
+
+class PostgresBackend(BroadcastBackend):
+    '''доставка между воркерами и контейнерами через LISTEN/NOTIFY postgres'''
+
+    def __init__(self, dsn: str, channel: str = settings.chat.broadcast_channel):
+        self.dsn = dsn
+        self.channel = channel
+        self.on_message: MessageHandler | None = None
+        self.listen_conn = None
+        self.publish_pool = None
+        self._reconnect_task: asyncio.Task | None = None
+        self._delivery_tasks: Set[asyncio.Task] = set()
+        self._stopping = False
+
+    async def start(self, on_message: MessageHandler):
+        import asyncpg
+
+        self.on_message = on_message
+        self._stopping = False
+        self.publish_pool = await asyncpg.create_pool(self.dsn, min_size=1, max_size=4)
+        await self._listen()
+
+    async def stop(self):
+        self._stopping = True
+        if self._reconnect_task is not None:
+            self._reconnect_task.cancel()
+        if self.listen_conn is not None and not self.listen_conn.is_closed():
+            await self.listen_conn.close()
+        if self.publish_pool is not None:
+            await self.publish_pool.close()
+
+    async def publish(self, chat_id: int, message: str):
+        payload = json.dumps({"chat_id": chat_id, "message": message}, ensure_ascii=False)
+        await self.publish_pool.execute("SELECT pg_notify($1, $2)", self.channel, payload)
+
+    async def _listen(self):
+        import asyncpg
+
+        self.listen_conn = await asyncpg.connect(self.dsn)
+        self.listen_conn.add_termination_listener(self._on_termination)
+        await self.listen_conn.add_listener(self.channel, self._on_notify)
+
+    def _on_notify(self, connection, pid, channel, payload: str):
+        data = json.loads(payload)
+        task = asyncio.create_task(self.on_message(data["chat_id"], data["message"]))
+        self._delivery_tasks.add(task)
+        task.add_done_callback(self._delivery_tasks.discard)
+
+    def _on_termination(self, connection):
+        if self._stopping:
+            return
+        logger.error("Соединение LISTEN с postgres потеряно, переподключение")
+        self._reconnect_task = asyncio.create_task(self._reconnect())
+
+    async def _reconnect(self):
+        delay = 0.5
+        while not self._stopping:
+            try:
+                await self._listen()
+                return
+            except Exception as e:
+                logger.error(f"Не удалось переподключиться к postgres: {e}")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 30)
+
+
+def create_backend(name: str = settings.chat.broadcast_backend) -> BroadcastBackend:
+    if name == "postgres":
+        return PostgresBackend(asyncpg_dsn())
+    return InProcessBackend()
@@ -0,0 +1,141 @@
+from fastapi import WebSocket
+
+from chat.backends import BroadcastBackend, create_backend
+from config import settings
+
+from typing import Dict, Set
+import asyncio
+import logging
+
+logger = logging.Logger(__name__)
+
+
+class Connection:
+    '''сокет с собственной ограниченной очередью исходящих сообщений и задачей-писателем'''
+
+    def __init__(self, websocket: WebSocket, queue_size: int):
+        self.websocket = websocket
+        self.queue: asyncio.Queue[str] = asyncio.Queue(maxsize=queue_size)
+        self.chat_ids: Set[int] = set()
+        self.writer: asyncio.Task | None = None
+
+
+class ConnectionManager:
+    '''реестр комнат: каждому chat_id соответствует набор подписанных на него сокетов'''
+
+    def __init__(
+        self,
+        backend: BroadcastBackend | None = None,
+        send_queue_size: int = settings.chat.send_queue_size,
+        send_queue_overflow: str = settings.chat.send_queue_overflow,
+    ):
+        self.backend = backend or create_backend()
+        self._started = False
+        self.send_queue_size = send_queue_size
+        self.send_queue_overflow = send_queue_overflow
+        self.rooms: Dict[int, Set[WebSocket]] = {}
+        self.connections: Dict[WebSocket, Connection] = {}
+        self._background_tasks: Set[asyncio.Task] = set()
+
+    async def start(self):
+        if not self._started:
+            self._started = True
+            await self.backend.start(self.deliver)
+
+    async def stop(self):
+        if self._started:
+            self._started = False
+            await self.backend.stop()
+
+    async def connect(self, websocket: WebSocket):
+        await self.start()
+        await websocket.accept()
+        connection = Connection(websocket, self.send_queue_size)
+        connection.writer = asyncio.create_task(self._write_loop(connection))
+        self.connections[websocket] = connection
+
+    def subscribe(self, websocket: WebSocket, chat_id: int):
+        self.rooms.setdefault(chat_id, set()).add(websocket)
+        self.connections[websocket].chat_ids.add(chat_id)
+
+    def is_subscribed(self, websocket: WebSocket, chat_id: int) -> bool:
+        connection = self.connections.get(websocket)
+        return connection is not None and chat_id in connection.chat_ids
+
+    def disconnect(self, websocket: WebSocket) -> Set[int]:
+        '''отписывает сокет от всех комнат и возвращает chat_id, в которых он состоял'''
+        connection = self.connections.pop(websocket, None)
+        if connection is None:
+            return set()
+
+        if connection.writer is not None:
+            connection.writer.cancel()
+        # освобождаем очередь, чтобы не повис send(), ожидающий места в ней
+        while not connection.queue.empty():
+            connection.queue.get_nowait()
+
+        for chat_id in connection.chat_ids:
+            room = self.rooms.get(chat_id)
+            if room is None:
+                continue
+            room.discard(websocket)
+            if not room:
+                del self.rooms[chat_id]
+        return connection.chat_ids
+
+    async def send(self, websocket: WebSocket, message: str):
+        '''ответ конкретному клиенту: ждет места в очереди, а не вытесняет его'''
+        connection = self.connections.get(websocket)
+        if connection is not None:
+            await connection.queue.put(message)
+
+    async def broadcast(self, chat_id: int, message: str):
+        '''публикует сообщение в шину, откуда его получат комнаты всех воркеров'''
+        await self.backend.publish(chat_id, message)
+
+    async def deliver(self, chat_id: int, message: str):
+        '''кладет сообщение в очереди локальных сокетов комнаты, не дожидаясь отправки по сети'''
+        for websocket in list(self.rooms.get(chat_id, ())):
+            self._enqueue(self.connections[websocket], message)
+
+    def _enqueue(self, connection: Connection, message: str):
+        try:
+            connection.queue.put_nowait(message)
+            return
+        except asyncio.QueueFull:
+            pass
+
+        if self.send_queue_overflow == "drop_newest":
+            logger.warning("Очередь клиента переполнена, сообщение отброшено")
+        elif self.send_queue_overflow == "drop_oldest":
+            connection.queue.get_nowait()
+            connection.queue.put_nowait(message)
+        else:
+            logger.warning("Очередь клиента переполнена, клиент отключен")
+            self._evict(connection)
+
+    def _evict(self, connection: Connection):
+        self.disconnect(connection.websocket)
+        task = asyncio.create_task(self._close(connection.websocket))
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+
+    async def _close(self, websocket: WebSocket):
+        try:
+            # 1013: try again later
+            await websocket.close(code=1013)
+        except Exception as e:
+            logger.error(f"Ошибка при закрытии соединения: {e}")
+
+    async def _write_loop(self, connection: Connection):
+        while True:
+            message = await connection.queue.get()
+            try:
+                await connection.websocket.send_text(message)
+            except Exception as e:
+                logger.error(f"Ошибка при отправке сообщения: {e}")
+                self._evict(connection)
+                return
+
+
+manager = ConnectionManager()
@@ -0,0 +1,156 @@
+from sqlalchemy import bindparam, insert, or_, update
+
+from database.database import async_session_maker
+from database.models import ChatParticipant, Message, UserChat
+from config import settings
+
+from typing import List, Tuple
+import asyncio
+import logging
+
+logger = logging.Logger(__name__)
+
+
+PREVIEW_LENGTH = UserChat.last_message_preview.type.length
+
+# сводка обновляется только вперед: пачки из разных воркеров могут закоммититься в любом порядке
+update_chat_summary = (
+    update(UserChat.__table__)
+    .where(
+        UserChat.__table__.c.id == bindparam('summary_chat_id'),
+        or_(
+            UserChat.__table__.c.last_message_id.is_(None),
+            UserChat.__table__.c.last_message_id < bindparam('summary_message_id'),
+        ),
+    )
+    .values(
+        last_message_id=bindparam('summary_message_id'),
+        last_message_time=bindparam('summary_time'),
+        last_message_preview=bindparam('summary_preview'),
+    )
+)
+
+update_participants_time = (
+    update(ChatParticipant.__table__)
+    .where(
+        ChatParticipant.__table__.c.chat_id == bindparam('summary_chat_id'),
+        ChatParticipant.__table__.c.last_message_time < bindparam('summary_time'),
+    )
+    .values(last_message_time=bindparam('summary_time'))
+)
+
+
+def chat_summaries(batch: List[Tuple[dict, asyncio.Future]], rows) -> List[dict]:
+    '''последнее сообщение каждого чата в пачке'''
+    latest = {}
+    for (values, _), row in zip(batch, rows):
+        latest[values["chat_id"]] = {
+            "summary_chat_id": values["chat_id"],
+            "summary_message_id": row.id,
+            "summary_time": row.sended_at,
+            "summary_preview": values["content"][:PREVIEW_LENGTH],
+        }
+    # строки обновляются в порядке chat_id, иначе пачки двух воркеров с чатами (A, B) и (B, A) могут взаимно заблокироваться
+    return sorted(latest.values(), key=lambda summary: summary["summary_chat_id"])
+
+
+class MessageWriter:
+    '''копит сообщения со всех сокетов и записывает их пачкой одним INSERT в одной транзакции'''
+
+    def __init__(
+        self,
+        session_maker=async_session_maker,
+        batch_size: int = settings.chat.write_batch_size,
+        flush_interval_ms: int = settings.chat.write_flush_interval_ms,
+    ):
+        self.session_maker = session_maker
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval_ms / 1000
+        self.queue: asyncio.Queue[Tuple[dict, asyncio.Future]] = asyncio.Queue()
+        self._task: asyncio.Task | None = None
+        # пачка, которая еще собирается, и пачка, которая сейчас записывается: stop() их дописывает
+        self._collecting: List[Tuple[dict, asyncio.Future]] = []
+        self._flushing: asyncio.Future | None = None
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+        # запись не прерывается отменой: ждем ее, иначе отправители пачки зависнут на write()
+        if self._flushing is not None:
+            await self._flushing
+            self._flushing = None
+
+        batch, self._collecting = self._collecting, []
+        while not self.queue.empty():
+            batch.append(self.queue.get_nowait())
+        if batch:
+            await self._flush(batch)
+
+    async def write(self, author_username: str, chat_id: int, content: str) -> Message:
+        '''возвращает сообщение с id и sended_at после коммита пачки, в которую оно попало'''
+        self.start()
+        future = asyncio.get_running_loop().create_future()
+        self.queue.put_nowait(({"author_username": author_username, "chat_id": chat_id, "content": content}, future))
+        return await future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = self._collecting
+            batch.append(await self.queue.get())
+            deadline = loop.time() + self.flush_interval
+
+            while len(batch) < self.batch_size:
+                if not self.queue.empty():
+                    batch.append(self.queue.get_nowait())
+                    continue
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            self._collecting = []
+            self._flushing = asyncio.ensure_future(self._flush(batch))
+            await asyncio.shield(self._flushing)
+            self._flushing = None
+
+    async def _flush(self, batch: List[Tuple[dict, asyncio.Future]]):
+        try:
+            async with self.session_maker() as session:
+                result = await session.execute(
+                    insert(Message).returning(Message.id, Message.sended_at, sort_by_parameter_order=True),
+                    [values for values, _ in batch],
+                )
+                rows = result.all()
+                summaries = chat_summaries(batch, rows)
+                await session.execute(update_chat_summary, summaries)
+                await session.execute(update_participants_time, summaries)
+                await session.commit()
+        except (Exception, asyncio.CancelledError) as e:
+            logger.error(f"Ошибка при сохранении пачки сообщений: {e!r}")
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e if isinstance(e, Exception) else RuntimeError("запись пачки прервана"))
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            return
+
+        for (values, future), row in zip(batch, rows):
+            if not future.done():
+                future.set_result(Message(id=row.id, sended_at=row.sended_at, **values))
+
+
+message_writer = MessageWriter()
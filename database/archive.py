@@ -0,0 +1,268 @@
+from sqlalchemy import delete, text, tuple_
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from sqlalchemy.future import select
+
+from config import settings
+from .database import async_session_maker
+from .models import Message
+
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Set, Tuple
+import asyncio
+import json
+import logging
+import mmap
+import os
+import struct
+import zlib
+
+logger = logging.Logger(__name__)
+
+EPOCH = datetime(1970, 1, 1)
+
+# ключ сообщения - (sended_at в микросекундах, id), тот же порядок, что и у истории в бд
+Key = Tuple[int, int]
+
+# запись индекса: первый ключ блока, последний ключ блока, смещение и длина сжатого блока в сегменте
+INDEX_RECORD = struct.Struct('<qqqqQI')
+
+# номер advisory lock, чтобы архивацию выполнял только один воркер
+ARCHIVE_LOCK_ID = 0x6d657373
+
+
+def to_micros(moment: datetime) -> int:
+    return (moment - EPOCH) // timedelta(microseconds=1)
+
+
+def from_micros(micros: int) -> datetime:
+    return EPOCH + timedelta(microseconds=micros)
+
+
+def message_key(message: Message) -> Key:
+    return to_micros(message.sended_at), message.id
+
+
+class MessageArchive:
+    '''холодный архив: на каждый чат append-only файл <chat_id>.seg со сжатыми zlib блоками
+    сообщений и файл <chat_id>.idx с записями фиксированной длины по одной на блок.
+    В архив попадает самый старый префикс истории чата, поэтому все его ключи меньше ключей в бд'''
+
+    def __init__(self, path: Path = settings.archive.path, block_size: int = settings.archive.block_size):
+        self.path = Path(path)
+        self.block_size = block_size
+
+    def _segment_path(self, chat_id: int) -> Path:
+        return self.path / f"{chat_id}.seg"
+
+    def _index_path(self, chat_id: int) -> Path:
+        return self.path / f"{chat_id}.idx"
+
+    def _read_index(self, chat_id: int) -> List[tuple]:
+        try:
+            data = self._index_path(chat_id).read_bytes()
+        except FileNotFoundError:
+            return []
+        # недописанная последняя запись (сбой посреди append) игнорируется
+        count = len(data) // INDEX_RECORD.size
+        return [INDEX_RECORD.unpack_from(data, i * INDEX_RECORD.size) for i in range(count)]
+
+    def last_key(self, chat_id: int) -> Key | None:
+        index = self._read_index(chat_id)
+        if not index:
+            return None
+        _, _, last_ts, last_id, _, _ = index[-1]
+        return last_ts, last_id
+
+    def append(self, chat_id: int, messages: List[Message]):
+        '''дописывает сообщения (по возрастанию ключа) блоками; сначала сегмент, потом индекс'''
+        self.path.mkdir(parents=True, exist_ok=True)
+        # хвост недописанной записи индекса обрезается, иначе все следующие записи сдвинутся
+        index_path = self._index_path(chat_id)
+        if index_path.exists():
+            size = index_path.stat().st_size
+            if size % INDEX_RECORD.size:
+                os.truncate(index_path, size - size % INDEX_RECORD.size)
+        with open(self._segment_path(chat_id), 'ab') as segment, open(index_path, 'ab') as index:
+            offset = segment.seek(0, os.SEEK_END)
+            records = []
+            for start in range(0, len(messages), self.block_size):
+                block = messages[start:start + self.block_size]
+                payload = zlib.compress(json.dumps(
+                    [[m.id, m.author_username, m.content, to_micros(m.sended_at)] for m in block],
+                    ensure_ascii=False,
+                ).encode('utf-8'))
+                segment.write(payload)
+                first, last = message_key(block[0]), message_key(block[-1])
+                records.append(INDEX_RECORD.pack(*first, *last, offset, len(payload)))
+                offset += len(payload)
+            segment.flush()
+            os.fsync(segment.fileno())
+            index.write(b''.join(records))
+            index.flush()
+            os.fsync(index.fileno())
+
+    def iter_blocks(self, chat_id: int) -> Iterator[List[Message]]:
+        '''все архивные сообщения чата по блокам, от старых к новым; в памяти одновременно один блок'''
+        index = self._read_index(chat_id)
+        if not index:
+            return
+        with open(self._segment_path(chat_id), 'rb') as segment, \
+                mmap.mmap(segment.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            for _, _, _, _, offset, length in index:
+                rows = json.loads(zlib.decompress(mapped[offset:offset + length]))
+                yield [self._to_message(chat_id, row) for row in rows]
+
+    def archived_keys(self, chat_id: int, keys: Iterable[Key]) -> Set[Key]:
+        '''какие из ключей действительно лежат в архиве; распаковываются только блоки, в диапазон которых они попадают'''
+        index = self._read_index(chat_id)
+        by_block: Dict[int, Set[Key]] = {}
+        for key in keys:
+            # последний блок, первый ключ которого не больше key
+            low, high = 0, len(index)
+            while low < high:
+                middle = (low + high) // 2
+                if (index[middle][0], index[middle][1]) <= key:
+                    low = middle + 1
+                else:
+                    high = middle
+            if low and key <= (index[low - 1][2], index[low - 1][3]):
+                by_block.setdefault(low - 1, set()).add(key)
+
+        found: Set[Key] = set()
+        if not by_block:
+            return found
+        with open(self._segment_path(chat_id), 'rb') as segment, \
+                mmap.mmap(segment.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            for block_number, wanted in by_block.items():
+                _, _, _, _, offset, length = index[block_number]
+                rows = json.loads(zlib.decompress(mapped[offset:offset + length]))
+                found.update(wanted & {(row[3], row[0]) for row in rows})
+        return found
+
+    @staticmethod
+    def _to_message(chat_id: int, row: list) -> Message:
+        message_id, author, content, sended_at = row
+        return Message(
+            id=message_id,
+            chat_id=chat_id,
+            author_username=author,
+            content=content,
+            sended_at=from_micros(sended_at),
+        )
+
+    def read_before(self, chat_id: int, before: Key | None, limit: int) -> Tuple[List[Message], bool]:
+        '''до limit сообщений с ключом меньше before, в порядке отправки, и признак, что есть еще'''
+        index = self._read_index(chat_id)
+        if not index:
+            return [], False
+
+        # последний блок, первый ключ которого меньше курсора
+        low, high = 0, len(index)
+        while low < high:
+            middle = (low + high) // 2
+            if before is None or (index[middle][0], index[middle][1]) < before:
+                low = middle + 1
+            else:
+                high = middle
+
+        collected: List[Message] = []
+        with open(self._segment_path(chat_id), 'rb') as segment, \
+                mmap.mmap(segment.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            for block_number in range(low - 1, -1, -1):
+                _, _, _, _, offset, length = index[block_number]
+                rows = json.loads(zlib.decompress(mapped[offset:offset + length]))
+                for row in reversed(rows):
+                    message_id, _, _, sended_at = row
+                    if before is not None and (sended_at, message_id) >= before:
+                        continue
+                    collected.append(self._to_message(chat_id, row))
+                if len(collected) > limit:
+                    break
+
+        return list(reversed(collected[:limit])), len(collected) > limit
+
+
+message_archive = MessageArchive()
+
+
+async def archive_chat(
+    chat_id: int,
+    cutoff: datetime,
+    archive: MessageArchive = message_archive,
+    session_maker: async_sessionmaker = async_session_maker,
+):
+    '''переносит сообщения чата старше cutoff в архив и удаляет их из бд'''
+    while True:
+        last = await asyncio.to_thread(archive.last_key, chat_id)
+        async with session_maker() as session:
+            if last is not None:
+                await delete_archived_leftovers(session, chat_id, last, archive)
+
+            query = select(Message).where(Message.chat_id == chat_id, Message.sended_at < cutoff)
+            if last is not None:
+                query = query.where(tuple_(Message.sended_at, Message.id) > tuple_(from_micros(last[0]), last[1]))
+            batch = (await session.execute(
+                query.order_by(Message.sended_at, Message.id).limit(archive.block_size * 16)
+            )).scalars().all()
+
+            if batch:
+                # в бд удаление только после того, как файлы записаны и сброшены на диск,
+                # и только тех строк, что записаны: параллельная вставка со старым sended_at останется в бд
+                await asyncio.to_thread(archive.append, chat_id, batch)
+                await session.execute(delete(Message).where(
+                    Message.chat_id == chat_id,
+                    Message.sended_at.between(batch[0].sended_at, batch[-1].sended_at),
+                    Message.id.in_([message.id for message in batch]),
+                ))
+            await session.commit()
+
+        if not batch:
+            return
+
+
+async def delete_archived_leftovers(session, chat_id: int, last: Key, archive: MessageArchive):
+    '''строки бд с ключом не больше последнего архивного: либо попали в архив до сбоя и не успели удалиться,
+    либо пришли позже со старым sended_at (например, из импорта). Удаляются только первые'''
+    rows = (await session.execute(select(Message.sended_at, Message.id).where(
+        Message.chat_id == chat_id,
+        tuple_(Message.sended_at, Message.id) <= tuple_(from_micros(last[0]), last[1]),
+    ))).all()
+    if not rows:
+        return
+
+    archived = await asyncio.to_thread(archive.archived_keys, chat_id, [(to_micros(sended_at), message_id) for sended_at, message_id in rows])
+    if archived:
+        await session.execute(delete(Message).where(
+            Message.chat_id == chat_id,
+            Message.id.in_([message_id for _, message_id in archived]),
+        ))
+    if len(archived) < len(rows):
+        logger.warning(f"Чат {chat_id}: {len(rows) - len(archived)} сообщений старше архива не архивированы и остаются в бд")
+
+
+async def archive_old_messages(max_age_days: int = settings.archive.max_age_days):
+    cutoff = datetime.now() - timedelta(days=max_age_days)
+    async with async_session_maker() as session:
+        locked = (await session.execute(text('SELECT pg_try_advisory_lock(:id)'), {'id': ARCHIVE_LOCK_ID})).scalar()
+        if not locked:
+            return
+        try:
+            chat_ids = (await session.execute(
+                select(Message.chat_id).where(Message.sended_at < cutoff).distinct()
+            )).scalars().all()
+            for chat_id in chat_ids:
+                await archive_chat(chat_id, cutoff)
+        finally:
+            await session.execute(text('SELECT pg_advisory_unlock(:id)'), {'id': ARCHIVE_LOCK_ID})
+            await session.commit()
+
+
+async def run_archiver(interval: int = settings.archive.interval):
+    '''фоновая задача из lifespan'''
+    while True:
+        try:
+            await archive_old_messages()
+        except Exception as e:
+            logger.error(f"Ошибка при архивации сообщений: {e}")
+        await asyncio.sleep(interval)
@@ -1,10 +1,15 @@
-from sqlalchemy import Integer, String, TIMESTAMP, Column, Boolean, ForeignKey, JSON
+from sqlalchemy import Integer, String, TIMESTAMP, Column, Boolean, ForeignKey, Index, DDL, Computed, event
+from sqlalchemy.dialects.postgresql import TSVECTOR
 from sqlalchemy.sql import func
-from sqlalchemy.orm import DeclarativeBase, relationship
+from sqlalchemy.orm import DeclarativeBase, deferred, relationship
 
 class Base(DeclarativeBase):
     pass
 
+
+# gin_trgm_ops для поиска по username нужен до создания таблиц
+event.listen(Base.metadata, 'before_create', DDL('CREATE EXTENSION IF NOT EXISTS pg_trgm'))
+
 class User(Base):
     __tablename__ = 'users'
     id = Column(Integer, primary_key=True)
@@ -16,23 +21,53 @@ class User(Base):
 
     sent_messages = relationship('Message', back_populates='author')
 
+    __table_args__ = (
+        Index('ix_users_username_trgm', 'username', postgresql_using='gin', postgresql_ops={'username': 'gin_trgm_ops'}),
+    )
+
 
 class Message(Base):
     __tablename__ = 'messages'
-    id = Column(Integer, primary_key=True)
+    # таблица секционирована по месяцам sended_at, поэтому он входит в первичный ключ
+    id = Column(Integer, primary_key=True, autoincrement=True)
     author_username = Column(String(length=24), ForeignKey('users.username'), nullable=False)
     content = Column(String(length=512), nullable=False)
-    sended_at = Column(TIMESTAMP, server_default=func.now())
+    sended_at = Column(TIMESTAMP, server_default=func.now(), primary_key=True)
     chat_id = Column(Integer, ForeignKey('user_chats.id'), nullable=False)
+    # полнотекстовый поиск по сообщениям; вычисляется postgres, в обычных выборках не загружается
+    search_vector = deferred(Column(TSVECTOR, Computed("to_tsvector('russian', content)", persisted=True)))
 
     author = relationship('User', back_populates='sent_messages')
     chat = relationship('UserChat', back_populates='messages', foreign_keys=[chat_id])  
 
+    __table_args__ = (
+        Index('ix_messages_chat_id_id', 'chat_id', 'id'),
+        Index('ix_messages_chat_id_sended_at_id', 'chat_id', 'sended_at', 'id'),
+        Index('ix_messages_search_vector', 'search_vector', postgresql_using='gin'),
+        {'postgresql_partition_by': 'RANGE (sended_at)'},
+    )
+
 
 class UserChat(Base):
     __tablename__ = 'user_chats'
     id = Column(Integer, primary_key=True)
-    participants = Column(JSON)
+    # сводка по последнему сообщению обновляется вместе с записью пачки сообщений
     last_message_time = Column(TIMESTAMP, server_default=func.now())
+    last_message_id = Column(Integer)
+    last_message_preview = Column(String(length=100))
+
+    messages = relationship('Message', back_populates='chat', lazy='dynamic')  
+
+
+class ChatParticipant(Base):
+    __tablename__ = 'chat_participants'
+    # первичный ключ (chat_id, user_id) - участники чата, индекс (user_id, chat_id) - чаты пользователя
+    chat_id = Column(Integer, ForeignKey('user_chats.id', ondelete='CASCADE'), primary_key=True)
+    user_id = Column(Integer, ForeignKey('users.id', ondelete='CASCADE'), primary_key=True)
+    # копия user_chats.last_message_time: список чатов пользователя читается по индексу уже отсортированным
+    last_message_time = Column(TIMESTAMP, server_default=func.now(), nullable=False)
 
-    messages = relationship('Message', back_populates='chat', lazy='dynamic')  
\ No newline at end of file
+    __table_args__ = (
+        Index('ix_chat_participants_user_id_chat_id', 'user_id', 'chat_id'),
+        Index('ix_chat_participants_user_id_last_message_time', 'user_id', last_message_time.desc()),
+    )
\ No newline at end of file
@@ -0,0 +1,59 @@
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from config import db_settings
+from .database import engine
+
+from datetime import date, datetime
+import asyncio
+import logging
+
+logger = logging.Logger(__name__)
+
+
+def month_start(day: date) -> date:
+    return date(day.year, day.month, 1)
+
+
+def next_month(day: date) -> date:
+    return date(day.year + day.month // 12, day.month % 12 + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    return f"messages_{month.year}_{month.month:02d}"
+
+
+def partition_ddl(month: date) -> str:
+    month = month_start(month)
+    return (
+        f"CREATE TABLE IF NOT EXISTS {partition_name(month)} PARTITION OF messages "
+        f"FOR VALUES FROM ('{month.isoformat()}') TO ('{next_month(month).isoformat()}')"
+    )
+
+
+async def ensure_message_partitions(conn: AsyncConnection, start: date, end: date):
+    '''создает недостающие месячные секции messages, покрывающие [start, end]'''
+    month = month_start(start)
+    while month <= end:
+        await conn.execute(text(partition_ddl(month)))
+        month = next_month(month)
+
+
+async def create_upcoming_partitions(months_ahead: int = db_settings.db_message_partitions_ahead):
+    today = datetime.now().date()
+    end = today
+    for _ in range(months_ahead):
+        end = next_month(end)
+
+    async with engine.begin() as conn:
+        await ensure_message_partitions(conn, today, end)
+
+
+async def run_partition_maintenance(interval: int = db_settings.db_partition_maintenance_interval):
+    '''фоновая задача из lifespan: заранее создает секции на ближайшие месяцы'''
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await create_upcoming_partitions()
+        except Exception as e:
+            logger.error(f"Ошибка при создании секций messages: {e}")
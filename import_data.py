@@ -0,0 +1,219 @@
+'''массовый импорт пользователей, чатов и сообщений из NDJSON/CSV через COPY
+
+python import_data.py --users users.ndjson --chats chats.csv --messages messages.ndjson
+
+users:    id, username, email, password (уже готовый хэш), registered_at, active
+chats:    id, participants (список id пользователей; в CSV - строка "1;2")
+messages: id, author_username, content, sended_at, chat_id
+
+Запущенные воркеры увидят новых пользователей в автодополнении после очередного
+перестроения индекса имен (search.username_index_refresh_interval)
+'''
+import asyncpg
+
+from database.database import asyncpg_dsn
+from database.partitions import month_start, partition_ddl
+
+from datetime import date, datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set
+import argparse
+import asyncio
+import csv
+import json
+import sys
+import time
+
+
+USER_COLUMNS = ("id", "username", "email", "password", "registered_at", "active")
+CHAT_COLUMNS = ("id",)
+PARTICIPANT_COLUMNS = ("chat_id", "user_id")
+MESSAGE_COLUMNS = ("id", "author_username", "content", "sended_at", "chat_id")
+
+
+def read_rows(path: Path) -> Iterator[Dict[str, Any]]:
+    '''построчно читает NDJSON (.ndjson/.jsonl) или CSV с заголовком'''
+    with open(path, encoding="utf-8", newline="") as f:
+        if path.suffix in (".ndjson", ".jsonl"):
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        elif path.suffix == ".csv":
+            yield from csv.DictReader(f)
+        else:
+            raise ValueError(f"Неизвестный формат файла: {path}")
+
+
+def parse_datetime(value: Any) -> Optional[datetime]:
+    if value in (None, ""):
+        return None
+    moment = datetime.fromisoformat(value)
+    # колонки TIMESTAMP без часового пояса хранят UTC
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(timezone.utc).replace(tzinfo=None)
+    return moment
+
+
+def parse_bool(value: Any) -> bool:
+    if value in (None, ""):
+        return True
+    if isinstance(value, str):
+        return value.strip().lower() in ("1", "true", "t", "yes")
+    return bool(value)
+
+
+def parse_participants(value: Any) -> List[int]:
+    if isinstance(value, str):
+        return [int(user_id) for user_id in value.split(";") if user_id]
+    return [int(user_id) for user_id in value]
+
+
+def user_record(row: Dict[str, Any]) -> tuple:
+    return (
+        int(row["id"]),
+        row["username"],
+        row.get("email") or None,
+        row["password"],
+        parse_datetime(row.get("registered_at")) or datetime.now(timezone.utc).replace(tzinfo=None),
+        parse_bool(row.get("active")),
+    )
+
+
+def message_record(row: Dict[str, Any]) -> tuple:
+    sended_at = parse_datetime(row.get("sended_at"))
+    # без времени не выбрать секцию, а колонка - часть первичного ключа
+    if sended_at is None:
+        raise ValueError(f"Сообщение id={row.get('id')}: не заполнен sended_at")
+    return (
+        int(row["id"]),
+        row["author_username"],
+        row["content"],
+        sended_at,
+        int(row["chat_id"]),
+    )
+
+
+def batched(rows: Iterable[Any], size: int) -> Iterator[List[Any]]:
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class Progress:
+    '''пишет в stderr количество загруженных строк и скорость'''
+
+    def __init__(self, name: str):
+        self.name = name
+        self.rows = 0
+        self.started = time.monotonic()
+
+    def add(self, count: int):
+        self.rows += count
+        elapsed = time.monotonic() - self.started
+        rate = self.rows / elapsed if elapsed > 0 else 0
+        print(f"\r{self.name}: {self.rows} строк, {rate:.0f} строк/с", end="", file=sys.stderr, flush=True)
+
+    def done(self):
+        print(file=sys.stderr)
+
+
+async def copy_users(conn: asyncpg.Connection, path: Path, batch_size: int):
+    progress = Progress("users")
+    for batch in batched(map(user_record, read_rows(path)), batch_size):
+        await conn.copy_records_to_table("users", records=batch, columns=USER_COLUMNS)
+        progress.add(len(batch))
+    progress.done()
+
+
+async def copy_chats(conn: asyncpg.Connection, path: Path, batch_size: int):
+    progress = Progress("user_chats")
+    for batch in batched(read_rows(path), batch_size):
+        chats = [(int(row["id"]),) for row in batch]
+        participants = [
+            (int(row["id"]), user_id)
+            for row in batch
+            for user_id in parse_participants(row["participants"])
+        ]
+        async with conn.transaction():
+            await conn.copy_records_to_table("user_chats", records=chats, columns=CHAT_COLUMNS)
+            await conn.copy_records_to_table("chat_participants", records=participants, columns=PARTICIPANT_COLUMNS)
+        progress.add(len(batch))
+    progress.done()
+
+
+async def copy_messages(conn: asyncpg.Connection, path: Path, batch_size: int):
+    progress = Progress("messages")
+    # COPY в секционированную таблицу падает, если для месяца нет секции
+    created: Set[date] = set()
+    for batch in batched(map(message_record, read_rows(path)), batch_size):
+        async with conn.transaction():
+            for month in {month_start(record[3]) for record in batch} - created:
+                await conn.execute(partition_ddl(month))
+                created.add(month)
+            await conn.copy_records_to_table("messages", records=batch, columns=MESSAGE_COLUMNS)
+        progress.add(len(batch))
+    progress.done()
+
+
+async def finalize(conn: asyncpg.Connection):
+    '''id пришли из файлов: сдвигаем последовательности и пересчитываем сводку чатов'''
+    for table in ("users", "user_chats", "messages"):
+        await conn.execute(
+            f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), "
+            f"coalesce((SELECT max(id) FROM {table}), 0) + 1, false)"
+        )
+
+    await conn.execute("""
+        UPDATE user_chats
+        SET last_message_id = latest.id,
+            last_message_time = latest.sended_at,
+            last_message_preview = left(latest.content, 100)
+        FROM (
+            SELECT DISTINCT ON (chat_id) chat_id, id, sended_at, content
+            FROM messages
+            ORDER BY chat_id, sended_at DESC, id DESC
+        ) AS latest
+        WHERE latest.chat_id = user_chats.id
+    """)
+    await conn.execute("""
+        UPDATE chat_participants
+        SET last_message_time = user_chats.last_message_time
+        FROM user_chats
+        WHERE user_chats.id = chat_participants.chat_id AND user_chats.last_message_time IS NOT NULL
+    """)
+
+
+async def run_import(args: argparse.Namespace):
+    conn = await asyncpg.connect(asyncpg_dsn())
+    try:
+        # порядок важен из-за внешних ключей
+        if args.users:
+            await copy_users(conn, args.users, args.batch_size)
+        if args.chats:
+            await copy_chats(conn, args.chats, args.batch_size)
+        if args.messages:
+            await copy_messages(conn, args.messages, args.batch_size)
+        await finalize(conn)
+    finally:
+        await conn.close()
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Импорт данных мессенджера через COPY")
+    parser.add_argument("--users", type=Path, help="файл пользователей (.ndjson/.jsonl/.csv)")
+    parser.add_argument("--chats", type=Path, help="файл чатов (.ndjson/.jsonl/.csv)")
+    parser.add_argument("--messages", type=Path, help="файл сообщений (.ndjson/.jsonl/.csv)")
+    parser.add_argument("--batch-size", type=int, default=10000, help="строк в одном COPY")
+    args = parser.parse_args(argv)
+    if not (args.users or args.chats or args.messages):
+        parser.error("нужен хотя бы один из --users, --chats, --messages")
+    return args
+
+
+if __name__ == "__main__":
+    asyncio.run(run_import(parse_args()))
@@ -1,21 +1,29 @@
 from fastapi import Depends, FastAPI, Form, APIRouter, HTTPException
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from starlette import status
 from contextlib import asynccontextmanager
 
 from database.models import User
 from database.database import create_db_and_tables, get_async_session
-from auth.utils import hash_password
+from auth.recent_write import get_read_session
+from database.partitions import create_upcoming_partitions, run_partition_maintenance
+from database.archive import run_archiver
+from config import settings
+from auth.utils import PasswordHasherBusy, check_password_scheme, hash_password_async
 from auth.auth import router as jwt_router
-from templates.router import router as base_router
+from templates.router import router as base_router, search_users
+from chat.manager import manager
+from chat.writer import message_writer
+from search.prefix_index import run_username_index_refresh, username_index, warm_username_index
 
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.future import select
 
 from typing import Optional
 from pydantic import BaseModel
 from datetime import datetime
+import asyncio
 
 
 app = FastAPI(title='messenger')
@@ -44,12 +52,36 @@ class UserResponse(BaseModel):
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    check_password_scheme()
     await create_db_and_tables()
+    # секции на текущий и ближайшие месяцы должны существовать до приема сообщений
+    await create_upcoming_partitions()
+    partition_maintenance = asyncio.create_task(run_partition_maintenance())
+    archiver = asyncio.create_task(run_archiver()) if settings.archive.enabled else None
+    await warm_username_index()
+    username_index_refresh = asyncio.create_task(run_username_index_refresh())
+    await manager.start()
+    message_writer.start()
     yield
+    await message_writer.stop()
+    await manager.stop()
+    partition_maintenance.cancel()
+    username_index_refresh.cancel()
+    if archiver is not None:
+        archiver.cancel()
 
 app = FastAPI(lifespan=lifespan)
 
 
+@app.exception_handler(PasswordHasherBusy)
+async def password_hasher_busy_handler(request, exc: PasswordHasherBusy):
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={'detail': 'Сервер перегружен, попробуйте позже'},
+        headers={'Retry-After': '1'},
+    )
+
+
 @app.post('/register', response_model=UserResponse)
 async def register(
     username: str = Form(...),
@@ -59,20 +91,26 @@ async def register(
 ):
     if email in [None, '', 'null']:
         email = None
-    hashed_password = hash_password(password).decode('utf-8')
+    hashed_password = (await hash_password_async(password)).decode('utf-8')
     new_user = User(username=username, password=hashed_password, email=email)
     session.add(new_user)
     await session.commit()
     await session.refresh(new_user)
+    # остальные воркеры увидят имя после ближайшего перестроения своего индекса
+    username_index.add(new_user.username)
     return new_user
 
 
 @app.post('/authenticated/search/{companion_name}')
-async def search(companion_name: str, session: AsyncSession = Depends(get_async_session)):
-    result = await session.execute(select(User).where(User.username.ilike(f"%{companion_name}%")))
-    companions = result.scalars().all()
+async def search(
+    companion_name: str,
+    after: Optional[str] = None,
+    limit: Optional[int] = None,
+    session: AsyncSession = Depends(get_read_session)
+):
+    companions = await search_users(session, companion_name, after, limit)
 
-    if not companions:
+    if not companions and after is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='Не найдено пользователей с похожим именем.')
     
     return companions
@@ -0,0 +1,89 @@
+from sqlalchemy.future import select
+
+from config import settings
+from database.database import async_session_maker
+from database.models import User
+
+from typing import Iterable, List, Tuple
+from bisect import bisect_left
+import asyncio
+import logging
+import sys
+
+logger = logging.Logger(__name__)
+
+
+class UsernamePrefixIndex:
+    '''индекс для автодополнения: отсортированный массив ключей (username в нижнем регистре)
+    и параллельный массив исходных имен. Поиск префикса - бинарный поиск, без обращения к бд.
+    Индекс свой у каждого процесса: имена, добавленные другими воркерами или импортом,
+    появляются после периодического перестроения (run_username_index_refresh)'''
+
+    def __init__(self):
+        self._keys: List[str] = []
+        self._names: List[str] = []
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def build(self, usernames: Iterable[str]):
+        self.load_sorted(sorted((name.lower(), name) for name in usernames))
+
+    def load_sorted(self, pairs: List[Tuple[str, str]]):
+        '''заменяет содержимое уже отсортированными парами (ключ, имя)'''
+        # если имя уже в нижнем регистре, ключ и имя - один и тот же объект строки
+        self._keys = [key if key != name else name for key, name in pairs]
+        self._names = [name for _, name in pairs]
+
+    def add(self, username: str):
+        key = username.lower()
+        position = bisect_left(self._keys, key)
+        while position < len(self._keys) and self._keys[position] == key:
+            if self._names[position] == username:
+                return
+            position += 1
+        self._keys.insert(position, key if key != username else username)
+        self._names.insert(position, username)
+
+    def search(self, prefix: str, limit: int = 10) -> List[str]:
+        prefix = prefix.lower()
+        if not prefix:
+            return []
+        result = []
+        position = bisect_left(self._keys, prefix)
+        while position < len(self._keys) and len(result) < limit and self._keys[position].startswith(prefix):
+            result.append(self._names[position])
+            position += 1
+        return result
+
+    def memory_usage(self) -> int:
+        '''занимаемая память в байтах: два массива указателей плюс сами строки (общие строки считаются один раз)'''
+        total = sys.getsizeof(self._keys) + sys.getsizeof(self._names)
+        for key, name in zip(self._keys, self._names):
+            total += sys.getsizeof(key)
+            if name is not key:
+                total += sys.getsizeof(name)
+        return total
+
+
+username_index = UsernamePrefixIndex()
+
+
+async def warm_username_index():
+    '''заполняет индекс при старте приложения; имена читаются потоком, без загрузки ORM-объектов'''
+    async with async_session_maker() as session:
+        result = await session.stream_scalars(select(User.username).execution_options(yield_per=10000))
+        usernames = [username async for username in result]
+    # сортировка всех имен заметно заняла бы event loop, поэтому в потоке; замена массивов - уже в loop
+    pairs = await asyncio.to_thread(sorted, [(name.lower(), name) for name in usernames])
+    username_index.load_sorted(pairs)
+
+
+async def run_username_index_refresh(interval: int = settings.search.username_index_refresh_interval):
+    '''фоновая задача из lifespan: подхватывает пользователей, зарегистрированных на других воркерах или импортированных'''
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await warm_username_index()
+        except Exception as e:
+            logger.error(f"Ошибка при обновлении индекса имен: {e}")
@@ -1,20 +1,38 @@
 from fastapi import APIRouter, Request, Depends, HTTPException, Request, WebSocket, WebSocketDisconnect, Cookie
 from fastapi.templating import Jinja2Templates
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, StreamingResponse, Response
 from starlette import status
 
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from sqlalchemy import String, cast
-
-from database.models import User, UserChat, Message
-from database.database import get_async_session
-from auth.validation import get_current_active_auth_user
+from sqlalchemy import and_, case, func, literal, literal_column, tuple_
+from sqlalchemy.dialects.postgresql import REGCONFIG
+from sqlalchemy.orm import aliased
+
+from database.models import User, UserChat, Message, ChatParticipant
+from database.database import get_async_session, async_session_maker
+from auth.recent_write import (
+    get_read_session,
+    mark_recent_write,
+    read_session_maker_for,
+    set_recent_write_cookie,
+    RECENT_WRITE_COOKIE,
+)
+from auth.validation import get_current_active_auth_user, get_current_access_token_payload
 from auth.utils import decode_jwt_ws
+from chat.manager import manager
+from chat.writer import message_writer
+from config import settings, db_settings
+from search.prefix_index import username_index
+from database.archive import message_archive, message_key, to_micros
 
-from typing import List
 from pydantic import BaseModel
+from datetime import datetime, timezone
+from typing import AsyncIterator
+import asyncio
+import json
 import logging
+import math
 
 logger = logging.Logger(__name__)
 
@@ -33,6 +51,39 @@ def generate_chat_id(user1_id: int, user2_id: int) -> str:
     return f"chat_{min(user1_id, user2_id)}_{max(user1_id, user2_id)}"
 
 
+def serialize_message(message: Message) -> dict:
+    return {
+        "id": message.id,
+        "chat_id": message.chat_id,
+        "author": message.author_username,
+        "content": message.content,
+        "sended_at": message.sended_at.isoformat() if message.sended_at else None,
+    }
+
+
+def message_frame(message: Message) -> str:
+    return json.dumps({"action": "message", **serialize_message(message)}, ensure_ascii=False)
+
+
+async def is_chat_participant(session: AsyncSession, chat_id: int, username: str) -> bool:
+    '''проверка членства по первичному ключу chat_participants'''
+    result = await session.execute(
+        select(ChatParticipant.chat_id)
+        .join(User, User.id == ChatParticipant.user_id)
+        .where(ChatParticipant.chat_id == chat_id, User.username == username)
+    )
+    return result.first() is not None
+
+
+async def get_chat_members(session: AsyncSession, chat_id: int) -> list[User]:
+    result = await session.execute(
+        select(User)
+        .join(ChatParticipant, ChatParticipant.user_id == User.id)
+        .where(ChatParticipant.chat_id == chat_id)
+    )
+    return result.scalars().all()
+
+
 async def get_companion_by_id(companion_id: int, session: AsyncSession) -> User:
     result = await session.execute(select(User).where(User.id == companion_id))
     companion = result.scalar_one_or_none()
@@ -41,6 +92,31 @@ async def get_companion_by_id(companion_id: int, session: AsyncSession) -> User:
     return companion
 
 
+def parse_search_limit(limit: int | None) -> int:
+    if limit is None:
+        return settings.search.page_size
+    return max(1, min(limit, settings.search.max_page_size))
+
+
+def search_users_query(query: str, after: str | None, limit: int):
+    '''поиск по подстроке (gin-индекс с триграммами): сначала совпадения по префиксу, затем по алфавиту.
+    after - username последнего пользователя предыдущей страницы'''
+    escaped = query.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    rank = case((User.username.ilike(f"{escaped}%", escape='\\'), 0), else_=1)
+
+    statement = select(User).where(User.username.ilike(f"%{escaped}%", escape='\\'))
+    if after is not None:
+        after_rank = 0 if after.lower().startswith(query.lower()) else 1
+        statement = statement.where(tuple_(rank, User.username) > tuple_(literal(after_rank), after))
+
+    return statement.order_by(rank, User.username).limit(limit)
+
+
+async def search_users(session: AsyncSession, query: str, after: str | None = None, limit: int | None = None) -> list[User]:
+    result = await session.execute(search_users_query(query, after, parse_search_limit(limit)))
+    return result.scalars().all()
+
+
 @router.get('/', response_class=HTMLResponse)
 async def get_base_page(request: Request):
     return templates.TemplateResponse(request, 'index.html', {'title': 'Добро пожаловать!'})
@@ -64,6 +140,7 @@ async def get_about_us_page(request: Request):
 @router.post('/create_chat/')
 async def create_chat(
     request: ChatRequest,
+    response: Response,
     session: AsyncSession = Depends(get_async_session),
     current_user: User = Depends(get_current_active_auth_user)
 ):
@@ -76,69 +153,68 @@ async def create_chat(
     
     if not companion_user:
         return templates.TemplateResponse(request, '404.html', {'title': 'Пользователь не найден'})
-    
-    existing_chat = (
+
+    if companion_user.id == current_user.id:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Нельзя создать чат с самим собой")
+
+    own = aliased(ChatParticipant)
+    companion = aliased(ChatParticipant)
+    existing_chat_id = (
         await session.execute(
-            select(UserChat).where(
-                cast(UserChat.participants['auth_user'], String).in_([current_user.username, companion_username]),
-                cast(UserChat.participants['companion_user'], String).in_([current_user.username, companion_username])
-            )
+            select(own.chat_id)
+            .join(companion, companion.chat_id == own.chat_id)
+            .where(own.user_id == current_user.id, companion.user_id == companion_user.id)
+            .limit(1)
         )
     ).scalar_one_or_none()
 
-    if existing_chat:
-        return {"message": "Чат уже существует", "chat_id": existing_chat.id}
+    if existing_chat_id:
+        return {"message": "Чат уже существует", "chat_id": existing_chat_id}
 
-    new_chat = UserChat(
-        participants={
-            "auth_user": current_user.username,
-            "companion": companion_username
-        }
-    )
+    new_chat = UserChat()
     session.add(new_chat)
+    await session.flush()
+    session.add_all([
+        ChatParticipant(chat_id=new_chat.id, user_id=current_user.id),
+        ChatParticipant(chat_id=new_chat.id, user_id=companion_user.id),
+    ])
     await session.commit()
-    await session.refresh(new_chat)
+    set_recent_write_cookie(response, mark_recent_write(current_user.username))
 
     return {"message": "Чат создан", "chat_id": new_chat.id}
 
 
-@router.get('/authenticated/', response_class=HTMLResponse)
-async def get_authenticated_page(
-    request: Request,
-    session: AsyncSession = Depends(get_async_session),
-    current_user: User = Depends(get_current_active_auth_user)
-):
-    all_chats = (
-        await session.execute(select(UserChat))
-    ).scalars().all()
+def chat_list_query(user_id: int):
+    '''чаты пользователя вместе с собеседниками одним запросом, без отдельного select на каждый чат.
+    Порядок по активности берется из индекса (user_id, last_message_time desc) на chat_participants'''
+    own = aliased(ChatParticipant)
+    companion = aliased(ChatParticipant)
+    return (
+        select(UserChat, User.username)
+        .select_from(own)
+        .join(UserChat, UserChat.id == own.chat_id)
+        .outerjoin(companion, and_(companion.chat_id == UserChat.id, companion.user_id != user_id))
+        .outerjoin(User, User.id == companion.user_id)
+        .where(own.user_id == user_id)
+        .order_by(own.last_message_time.desc())
+    )
 
 
-    result_chat = [
-        chat for chat in all_chats
-        if chat.participants.get("auth_user") == current_user.username
+async def load_chat_list(session: AsyncSession, user_id: int) -> list[dict]:
+    result = await session.execute(chat_list_query(user_id))
+    return [
+        {'chat': chat, 'companion_name': companion_username or "Аноним"}
+        for chat, companion_username in result.all()
     ]
 
 
-    if not result_chat:
-        result_chat = [
-            chat for chat in all_chats
-            if chat.participants.get("companion") == current_user.username
-        ]
-
-    chats_with_companion = []
-    for chat in result_chat:
-        companion_username = (
-            chat.participants["companion"]
-            if chat.participants["auth_user"] == current_user.username
-            else chat.participants["auth_user"]
-        )
-
-        companion_user = (
-            await session.execute(select(User).where(User.username == companion_username))
-        ).scalar_one_or_none()
-
-        companion_name = companion_user.username if companion_user else "Аноним"
-        chats_with_companion.append({'chat': chat, 'companion_name': companion_name})
+@router.get('/authenticated/', response_class=HTMLResponse)
+async def get_authenticated_page(
+    request: Request,
+    session: AsyncSession = Depends(get_read_session),
+    current_user: User = Depends(get_current_active_auth_user)
+):
+    chats_with_companion = await load_chat_list(session, current_user.id)
 
     return templates.TemplateResponse(request, 'auth_index.html', {
         'title': 'Главная',
@@ -149,46 +225,128 @@ async def get_authenticated_page(
 
 
 
+@router.get('/authenticated/search/autocomplete')
+async def autocomplete_username(
+    prefix: str,
+    limit: int = 10,
+    payload: dict = Depends(get_current_access_token_payload),
+):
+    '''автодополнение имени по префиксу из индекса в памяти; проверяется только токен, без запроса к бд'''
+    return username_index.search(prefix, max(1, min(limit, settings.search.max_page_size)))
+
+
 @router.get('/authenticated/search/', response_class=HTMLResponse)
 async def get_search_page(
     request: Request,
     query: str = '',
-    session: AsyncSession = Depends(get_async_session),
     current_user: User = Depends(get_current_active_auth_user),
 ):
-    users = []
-    if query:  
-        result = await session.execute(select(User).where(User.username.ilike(f"%{query}%")))
-        users = result.scalars().all()
-    
+    '''сама выдача и ее страницы запрашиваются со страницы через POST /authenticated/search/{companion_name}'''
     return templates.TemplateResponse(request, 'search.html', {
         'title': 'Поиск',
         'current_user': current_user,
-        'users': users,  
         'query': query,
+        'page_size': settings.search.page_size,
     })
 
 
-class ConnectionManager:
-    def __init__(self):
-        self.active_connections: List[WebSocket] = []
+def naive_utc(moment: datetime) -> datetime:
+    '''sended_at хранится без часового пояса, в UTC'''
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(timezone.utc).replace(tzinfo=None)
+    return moment
 
-    async def connect(self, websocket: WebSocket):
-        await websocket.accept()
-        self.active_connections.append(websocket)
 
-    def disconnect(self, websocket: WebSocket):
-        self.active_connections.remove(websocket)
+def parse_history_limit(limit) -> int:
+    if limit is None:
+        return settings.chat.history_page_size
+    return max(1, min(int(limit), settings.chat.history_max_page_size))
 
-    async def broadcast(self, message: str):
-        for connection in self.active_connections:
-            try:
-                await connection.send_text(message)
-            except Exception as e:
-                logger.error(f"Ошибка при отправке сообщения: {e}")
+
+def history_page_query(chat_id: int, before_id: int | None, limit: int, before_sended_at: datetime | None = None):
+    '''страница истории по ключу (sended_at, id) - идет по индексу (chat_id, sended_at, id).
+    Если клиент прислал before_sended_at, курсор не нужно искать по id, и лишние секции отсекаются'''
+    query = select(Message).where(Message.chat_id == chat_id)
+    if before_id is not None:
+        if before_sended_at is None:
+            before_sended_at = select(Message.sended_at).where(Message.id == before_id).scalar_subquery()
+        query = query.where(tuple_(Message.sended_at, Message.id) < tuple_(before_sended_at, before_id))
+
+    # берем на одну строку больше, чтобы узнать, есть ли еще более старые сообщения
+    return query.order_by(Message.sended_at.desc(), Message.id.desc()).limit(limit + 1)
+
+
+async def load_history_page(
+    session: AsyncSession,
+    chat_id: int,
+    before_id: int | None,
+    limit: int,
+    before_sended_at: datetime | None = None,
+):
+    '''сообщения старше курсора, в порядке отправки; когда в бд они кончаются, страница добирается из архива'''
+    result = await session.execute(history_page_query(chat_id, before_id, limit, before_sended_at))
+    messages = result.scalars().all()
+
+    has_more = len(messages) > limit
+    messages = list(reversed(messages[:limit]))
+
+    if not has_more and settings.archive.enabled:
+        if messages:
+            cursor = message_key(messages[0])
+        elif before_id is not None and before_sended_at is not None:
+            cursor = (to_micros(before_sended_at), before_id)
+        elif before_id is not None:
+            # курсор уже в архиве, а клиент не прислал его время
+            return messages, False
+        else:
+            cursor = None
+        older, has_more = await asyncio.to_thread(
+            message_archive.read_before, chat_id, cursor, limit - len(messages)
+        )
+        messages = older + messages
+
+    return messages, has_more
 
 
-manager = ConnectionManager()
+async def load_messages_after(session: AsyncSession, chat_id: int, after_id: int, limit: int):
+    '''сообщения новее after_id (догрузка пропущенного после переподключения)'''
+    result = await session.execute(
+        select(Message)
+        .where(Message.chat_id == chat_id, Message.id > after_id)
+        .order_by(Message.id.asc())
+        .limit(limit + 1)
+    )
+    messages = result.scalars().all()
+    return messages[:limit], len(messages) > limit
+
+
+def search_messages_query(chat_id: int, query: str, before_id: int | None, before_sended_at: datetime | None, limit: int):
+    '''полнотекстовый поиск по gin-индексу search_vector, от новых к старым.
+    Страницы по ключу (sended_at, id) последнего найденного сообщения, как в истории'''
+    statement = select(Message).where(
+        Message.chat_id == chat_id,
+        Message.search_vector.op('@@')(func.websearch_to_tsquery(literal_column("'russian'", REGCONFIG), query)),
+    )
+    if before_id is not None:
+        if before_sended_at is None:
+            before_sended_at = select(Message.sended_at).where(Message.id == before_id).scalar_subquery()
+        statement = statement.where(tuple_(Message.sended_at, Message.id) < tuple_(before_sended_at, before_id))
+
+    return statement.order_by(Message.sended_at.desc(), Message.id.desc()).limit(limit + 1)
+
+
+async def search_messages(
+    session: AsyncSession,
+    chat_id: int,
+    query: str,
+    before_id: int | None = None,
+    before_sended_at: datetime | None = None,
+    limit: int | None = None,
+):
+    limit = parse_search_limit(limit)
+    result = await session.execute(search_messages_query(chat_id, query, before_id, before_sended_at, limit))
+    messages = result.scalars().all()
+    return messages[:limit], len(messages) > limit
 
 
 async def verify_user(access_token: str = Cookie(None)):
@@ -218,12 +376,12 @@ async def get_chat_page(
     if not chat:
         return templates.TemplateResponse(request, '404.html', {'title': 'Пользователь не найден'})
 
-    participants = chat.participants
-    if current_user.username not in [participants["auth_user"], participants["companion"]]:
+    members = await get_chat_members(session, chat_id)
+    if current_user.id not in [member.id for member in members]:
         return templates.TemplateResponse(request, '403.html', {'title': 'Недостаточно прав'})
 
-    companion_username = (
-        participants["companion"] if participants["auth_user"] == current_user.username else participants["auth_user"]
+    companion_username = next(
+        (member.username for member in members if member.id != current_user.id), current_user.username
     )
 
     return templates.TemplateResponse(request, 'chat.html', {
@@ -231,54 +389,204 @@ async def get_chat_page(
         'chat_id': chat_id,
         'companion_username': companion_username,
         'current_user': current_user,
+        'sync_overlap': settings.chat.sync_overlap_ids,
     })
 
 
+async def export_chat_lines(chat_id: int, username: str, recent_write: str | None = None) -> AsyncIterator[str]:
+    '''история чата построчно в ndjson: сначала архив по блокам, затем бд через серверный курсор'''
+    if settings.archive.enabled:
+        blocks = message_archive.iter_blocks(chat_id)
+        try:
+            while (block := await asyncio.to_thread(next, blocks, None)) is not None:
+                yield "".join(json.dumps(serialize_message(msg), ensure_ascii=False) + "\n" for msg in block)
+        finally:
+            blocks.close()
+
+    async with read_session_maker_for(username, recent_write)() as session:
+        messages = await session.stream_scalars(
+            select(Message)
+            .where(Message.chat_id == chat_id)
+            .order_by(Message.sended_at.asc(), Message.id.asc())
+            .execution_options(yield_per=1000)
+        )
+        async for partition in messages.partitions():
+            yield "".join(json.dumps(serialize_message(msg), ensure_ascii=False) + "\n" for msg in partition)
+
+
+@router.get('/authenticated/chat/{chat_id}/export')
+async def export_chat(
+    chat_id: int,
+    recent_write: str | None = Cookie(None),
+    session: AsyncSession = Depends(get_async_session),
+    current_user: User = Depends(get_current_active_auth_user)
+):
+    '''выгрузка всей истории чата потоком ndjson с постоянным расходом памяти'''
+    if not await is_chat_participant(session, chat_id, current_user.username):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Недостаточно прав")
+
+    return StreamingResponse(
+        export_chat_lines(chat_id, current_user.username, recent_write),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="chat_{chat_id}.ndjson"'},
+    )
+
+
+@router.get('/authenticated/chat/{chat_id}/search')
+async def search_chat_messages(
+    chat_id: int,
+    q: str,
+    before_id: int | None = None,
+    before_sended_at: datetime | None = None,
+    limit: int | None = None,
+    session: AsyncSession = Depends(get_read_session),
+    current_user: User = Depends(get_current_active_auth_user)
+):
+    '''поиск сообщений в чате; следующая страница - before_id последнего найденного (с before_sended_at лишние секции не читаются)'''
+    if not await is_chat_participant(session, chat_id, current_user.username):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Недостаточно прав")
+
+    if before_sended_at is not None:
+        if before_id is None:
+            raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail="before_sended_at без before_id")
+        before_sended_at = naive_utc(before_sended_at)
+    messages, has_more = await search_messages(session, chat_id, q, before_id, before_sended_at, limit)
+    return {"messages": [serialize_message(message) for message in messages], "has_more": has_more}
+
+
 @router.websocket("/authenticated/chat/")
 async def chat_websocket(
     websocket: WebSocket,
     access_token: str = Cookie(None),
-    session: AsyncSession = Depends(get_async_session)
 ):
+    '''сессия бд берется только на время одной операции: простаивающие сокеты не держат соединения пула'''
     try:
         user = await verify_user(access_token)
-        await manager.connect(websocket)
-        await manager.broadcast(f"{user} зашел в чат.")
+    except HTTPException:
+        await websocket.close(code=1008)
+        return
 
+    await manager.connect(websocket)
+    try:
         while True:
-            data = await websocket.receive_json()
-
-            if data.get("action") == "load_history":
-                chat_id = data.get("chat_id")
-                if not chat_id:
-                    await websocket.send_text("Ошибка: chat_id не указан.")
-                    continue
-
-                messages = await session.execute(
-                    select(Message)
-                    .where(Message.chat_id == int(chat_id))
-                    .order_by(Message.sended_at.asc())
-                )
-                messages = messages.scalars().all()
-
-                for msg in messages:
-                    await websocket.send_text(f"{msg.author_username}: {msg.content}")
-
-            elif data.get("action") == "send_message":
-                message_content = data.get("content")
-                chat_id = data.get("chat_id")
-
-                if not message_content or not chat_id:
-                    await websocket.send_text("Ошибка: Сообщение или chat_id не указаны.")
-                    continue
-
-                await manager.broadcast(f"{user}: {message_content}")
-
-                new_message = Message(content=message_content, author_username=user, chat_id=int(chat_id))
-                session.add(new_message)
-                await session.commit()
+            try:
+                data = await websocket.receive_json()
+
+                if data.get("action") == "subscribe":
+                    chat_id = data.get("chat_id")
+                    if not chat_id:
+                        await manager.send(websocket, "Ошибка: chat_id не указан.")
+                        continue
+
+                    async with async_session_maker() as session:
+                        allowed = await is_chat_participant(session, int(chat_id), user)
+
+                    if not allowed:
+                        await manager.send(websocket, "Ошибка: нет доступа к чату.")
+                        continue
+
+                    manager.subscribe(websocket, int(chat_id))
+                    await manager.broadcast(int(chat_id), f"{user} зашел в чат.")
+
+                elif data.get("action") == "load_history":
+                    chat_id = data.get("chat_id")
+                    if not chat_id:
+                        await manager.send(websocket, "Ошибка: chat_id не указан.")
+                        continue
+
+                    if not manager.is_subscribed(websocket, int(chat_id)):
+                        await manager.send(websocket, "Ошибка: сначала подпишитесь на чат.")
+                        continue
+
+                    try:
+                        limit = parse_history_limit(data.get("limit"))
+                        before_id = int(data["before_id"]) if data.get("before_id") else None
+                        before_sended_at = (
+                            naive_utc(datetime.fromisoformat(data["before_sended_at"])) if data.get("before_sended_at") else None
+                        )
+                    except (TypeError, ValueError):
+                        await manager.send(websocket, "Ошибка: некорректные параметры истории.")
+                        continue
+
+                    async with read_session_maker_for(user)() as session:
+                        messages, has_more = await load_history_page(
+                            session, int(chat_id), before_id, limit, before_sended_at
+                        )
+                    await manager.send(websocket, json.dumps({
+                        "action": "history",
+                        "chat_id": int(chat_id),
+                        "messages": [serialize_message(msg) for msg in messages],
+                        "has_more": has_more,
+                    }, ensure_ascii=False))
+
+                elif data.get("action") == "sync":
+                    chat_id = data.get("chat_id")
+                    if not chat_id:
+                        await manager.send(websocket, "Ошибка: chat_id не указан.")
+                        continue
+
+                    if not manager.is_subscribed(websocket, int(chat_id)):
+                        await manager.send(websocket, "Ошибка: сначала подпишитесь на чат.")
+                        continue
+
+                    try:
+                        limit = parse_history_limit(data.get("limit"))
+                        after_id = int(data.get("after_id") or 0)
+                    except (TypeError, ValueError):
+                        await manager.send(websocket, "Ошибка: некорректные параметры синхронизации.")
+                        continue
+
+                    async with read_session_maker_for(user)() as session:
+                        messages, has_more = await load_messages_after(session, int(chat_id), after_id, limit)
+                    await manager.send(websocket, json.dumps({
+                        "action": "sync",
+                        "chat_id": int(chat_id),
+                        "messages": [serialize_message(msg) for msg in messages],
+                        "has_more": has_more,
+                    }, ensure_ascii=False))
+
+                elif data.get("action") == "send_message":
+                    message_content = data.get("content")
+                    chat_id = data.get("chat_id")
+
+                    if not isinstance(message_content, str) or not message_content or not chat_id:
+                        await manager.send(websocket, "Ошибка: Сообщение или chat_id не указаны.")
+                        continue
+
+                    if not manager.is_subscribed(websocket, int(chat_id)):
+                        await manager.send(websocket, "Ошибка: сначала подпишитесь на чат.")
+                        continue
+
+                    # одно слишком длинное сообщение провалило бы INSERT всей пачки
+                    if len(message_content) > Message.content.type.length:
+                        await manager.send(websocket, "Ошибка: сообщение слишком длинное.")
+                        continue
+
+                    try:
+                        new_message = await message_writer.write(author_username=user, chat_id=int(chat_id), content=message_content)
+                    except Exception:
+                        await manager.send(websocket, "Ошибка: сообщение не сохранено.")
+                        continue
+
+                    # куку ставит страница: по ней остальные воркеры тоже читают этого пользователя с primary
+                    await manager.send(websocket, json.dumps({
+                        "action": "recent_write",
+                        "cookie": RECENT_WRITE_COOKIE,
+                        "token": mark_recent_write(user),
+                        "max_age": math.ceil(db_settings.db_read_your_writes_seconds),
+                    }))
+
+                    # рассылка после коммита пачки служит отправителю подтверждением записи
+                    await manager.broadcast(int(chat_id), message_frame(new_message))
+            except (TypeError, ValueError, KeyError, AttributeError):
+                # битый json, chat_id не числом и т.п. - ошибка клиенту, соединение живет дальше
+                await manager.send(websocket, "Ошибка: некорректный запрос.")
     except WebSocketDisconnect:
-        manager.disconnect(websocket)
-        await manager.broadcast(f"{user} вышел из чата.")
-    except HTTPException as e:
-        await websocket.close(code=1008)
\ No newline at end of file
+        pass
+    finally:
+        # любое завершение цикла снимает сокет с комнат и останавливает его writer
+        for chat_id in manager.disconnect(websocket):
+            try:
+                await manager.broadcast(chat_id, f"{user} вышел из чата.")
+            except Exception as e:
+                logger.error(f"Ошибка при рассылке выхода из чата: {e}")
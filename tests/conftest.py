@@ -0,0 +1,44 @@
+import asyncpg
+import pytest
+import pytest_asyncio
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.pool import NullPool
+
+from config import db_settings
+from database.database import asyncpg_dsn
+from database.models import Base
+
+
+@pytest_asyncio.fixture
+async def db_session():
+    '''сессия к настоящему postgres внутри откатываемой транзакции; без бд тест пропускается'''
+    engine = create_async_engine(db_settings.db_url, poolclass=NullPool, connect_args={"timeout": 3})
+    try:
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+    except Exception as e:
+        await engine.dispose()
+        pytest.skip(f"postgres недоступен: {e}")
+
+    async with engine.connect() as conn:
+        transaction = await conn.begin()
+        session = AsyncSession(bind=conn, expire_on_commit=False, join_transaction_mode="create_savepoint")
+        try:
+            yield session
+        finally:
+            await session.close()
+            await transaction.rollback()
+
+    await engine.dispose()
+
+
+@pytest_asyncio.fixture
+async def postgres_dsn():
+    '''DSN для прямых подключений asyncpg; без бд тест пропускается'''
+    dsn = asyncpg_dsn()
+    try:
+        conn = await asyncpg.connect(dsn, timeout=3)
+    except Exception as e:
+        pytest.skip(f"postgres недоступен: {e}")
+    await conn.close()
+    return dsn
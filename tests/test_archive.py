@@ -0,0 +1,131 @@
+from contextlib import nullcontext
+from datetime import date, datetime, timedelta
+
+import pytest
+from sqlalchemy import select
+
+from database.archive import MessageArchive, archive_chat, message_key
+from database.models import ChatParticipant, Message, User, UserChat
+
+
+def make_messages(count: int, chat_id: int = 1) -> list[Message]:
+    start = datetime(2024, 1, 1)
+    return [
+        Message(id=i, chat_id=chat_id, author_username="alice", content=f"сообщение {i}", sended_at=start + timedelta(seconds=i))
+        for i in range(1, count + 1)
+    ]
+
+
+def test_pages_are_read_backwards_across_blocks(tmp_path):
+    archive = MessageArchive(path=tmp_path, block_size=16)
+    messages = make_messages(100)
+    archive.append(1, messages[:60])
+    archive.append(1, messages[60:])
+
+    page, has_more = archive.read_before(1, None, 30)
+    assert [m.id for m in page] == list(range(71, 101))
+    assert has_more
+
+    page, has_more = archive.read_before(1, message_key(page[0]), 30)
+    assert [m.id for m in page] == list(range(41, 71))
+    assert page[0].content == "сообщение 41"
+    assert page[0].sended_at == messages[40].sended_at
+
+    page, has_more = archive.read_before(1, message_key(messages[10]), 30)
+    assert [m.id for m in page] == list(range(1, 11))
+    assert not has_more
+
+
+def test_last_key_and_missing_chat(tmp_path):
+    archive = MessageArchive(path=tmp_path, block_size=16)
+    assert archive.last_key(1) is None
+    assert archive.read_before(1, None, 10) == ([], False)
+
+    messages = make_messages(20)
+    archive.append(1, messages)
+
+    assert archive.last_key(1) == message_key(messages[-1])
+
+
+def test_torn_index_record_is_ignored(tmp_path):
+    archive = MessageArchive(path=tmp_path, block_size=16)
+    archive.append(1, make_messages(20))
+    with open(tmp_path / "1.idx", "ab") as index:
+        index.write(b"\x00" * 7)
+
+    page, _ = archive.read_before(1, None, 50)
+    assert len(page) == 20
+
+
+def test_append_after_torn_index_record(tmp_path):
+    archive = MessageArchive(path=tmp_path, block_size=16)
+    messages = make_messages(40)
+    archive.append(1, messages[:20])
+    with open(tmp_path / "1.idx", "ab") as index:
+        index.write(b"\x00" * 7)
+
+    archive.append(1, messages[20:])
+
+    assert archive.last_key(1) == message_key(messages[-1])
+    page, has_more = archive.read_before(1, None, 50)
+    assert [m.id for m in page] == list(range(1, 41))
+    assert not has_more
+
+
+def test_iter_blocks_yields_everything_in_order(tmp_path):
+    archive = MessageArchive(path=tmp_path, block_size=16)
+    archive.append(1, make_messages(40))
+
+    blocks = list(archive.iter_blocks(1))
+
+    assert [len(block) for block in blocks] == [16, 16, 8]
+    assert [m.id for block in blocks for m in block] == list(range(1, 41))
+    assert list(archive.iter_blocks(2)) == []
+
+
+def test_archived_keys_finds_only_archived_messages(tmp_path):
+    archive = MessageArchive(path=tmp_path, block_size=16)
+    messages = make_messages(40)
+    archive.append(1, messages[:20])
+    archive.append(1, messages[20:])
+
+    archived = [message_key(messages[3]), message_key(messages[25])]
+    # пришло позже: ключ внутри диапазона блока, но в самом блоке его нет
+    late = (message_key(messages[3])[0], 1000)
+    outside = (message_key(messages[-1])[0] + 1, 1001)
+
+    assert archive.archived_keys(1, archived + [late, outside]) == set(archived)
+    assert archive.archived_keys(2, archived) == set()
+
+
+@pytest.mark.asyncio
+async def test_recovery_keeps_late_rows_that_are_not_archived(db_session, tmp_path):
+    from database.partitions import ensure_message_partitions
+
+    await ensure_message_partitions(await db_session.connection(), date(2024, 1, 1), date(2024, 1, 1))
+    author = User(username="archive_author", password="hash")
+    chat = UserChat()
+    db_session.add_all([author, chat])
+    await db_session.flush()
+    db_session.add(ChatParticipant(chat_id=chat.id, user_id=author.id))
+
+    start = datetime(2024, 1, 1)
+    messages = [
+        Message(author_username=author.username, chat_id=chat.id, content=f"сообщение {i}", sended_at=start + timedelta(seconds=i))
+        for i in range(20)
+    ]
+    db_session.add_all(messages)
+    await db_session.flush()
+
+    # сбой: блоки записаны в архив, а удалить строки из бд не успели
+    archive = MessageArchive(path=tmp_path, block_size=16)
+    archive.append(chat.id, messages)
+    # после этого импорт добавил сообщение со старым sended_at
+    late = Message(author_username=author.username, chat_id=chat.id, content="из импорта", sended_at=start + timedelta(seconds=5, milliseconds=500))
+    db_session.add(late)
+    await db_session.flush()
+
+    await archive_chat(chat.id, start, archive, session_maker=lambda: nullcontext(db_session))
+
+    left = (await db_session.execute(select(Message.id).where(Message.chat_id == chat.id))).scalars().all()
+    assert left == [late.id]
@@ -0,0 +1,146 @@
+import asyncio
+import uuid
+
+import pytest
+
+from chat.backends import InProcessBackend, PostgresBackend
+from chat.manager import ConnectionManager
+
+
+class FakeWebSocket:
+    def __init__(self, stalled: bool = False):
+        self.sent = []
+        self.closed_with = None
+        self.stalled = stalled
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, message: str):
+        if self.stalled:
+            await asyncio.Event().wait()
+        self.sent.append(message)
+
+    async def close(self, code: int = 1000):
+        self.closed_with = code
+
+
+async def flush():
+    for _ in range(3):
+        await asyncio.sleep(0)
+
+
+async def close_all(manager: ConnectionManager):
+    for ws in list(manager.connections):
+        manager.disconnect(ws)
+    await flush()
+
+
+@pytest.mark.asyncio
+async def test_broadcast_only_reaches_chat_room():
+    manager = ConnectionManager()
+    alice, bob, eve = FakeWebSocket(), FakeWebSocket(), FakeWebSocket()
+    for ws in (alice, bob, eve):
+        await manager.connect(ws)
+
+    manager.subscribe(alice, 1)
+    manager.subscribe(bob, 1)
+    manager.subscribe(eve, 2)
+
+    await manager.broadcast(1, "alice: привет")
+    await flush()
+
+    assert alice.sent == ["alice: привет"]
+    assert bob.sent == ["alice: привет"]
+    assert eve.sent == []
+    await close_all(manager)
+
+
+@pytest.mark.asyncio
+async def test_disconnect_cleans_up_rooms():
+    manager = ConnectionManager()
+    ws = FakeWebSocket()
+    await manager.connect(ws)
+    manager.subscribe(ws, 1)
+    manager.subscribe(ws, 2)
+
+    assert manager.disconnect(ws) == {1, 2}
+    assert manager.rooms == {}
+    assert not manager.is_subscribed(ws, 1)
+
+
+@pytest.mark.asyncio
+async def test_slow_consumer_is_evicted_without_blocking_others():
+    manager = ConnectionManager(send_queue_size=2, send_queue_overflow="disconnect")
+    slow, fast = FakeWebSocket(stalled=True), FakeWebSocket()
+    for ws in (slow, fast):
+        await manager.connect(ws)
+        manager.subscribe(ws, 1)
+
+    for i in range(5):
+        await manager.broadcast(1, f"msg {i}")
+        await flush()
+
+    assert fast.sent == [f"msg {i}" for i in range(5)]
+    assert slow.closed_with == 1013
+    assert not manager.is_subscribed(slow, 1)
+    await close_all(manager)
+
+
+@pytest.mark.asyncio
+async def test_drop_oldest_keeps_latest_messages():
+    manager = ConnectionManager(send_queue_size=2, send_queue_overflow="drop_oldest")
+    ws = FakeWebSocket()
+    await manager.connect(ws)
+    manager.subscribe(ws, 1)
+
+    for i in range(4):
+        await manager.broadcast(1, f"msg {i}")
+    await flush()
+
+    assert ws.sent == ["msg 2", "msg 3"]
+    await close_all(manager)
+
+
+@pytest.mark.asyncio
+async def test_shared_backend_delivers_across_managers():
+    backend = InProcessBackend()
+    worker_a, worker_b = ConnectionManager(backend=backend), ConnectionManager(backend=backend)
+    alice, bob = FakeWebSocket(), FakeWebSocket()
+    await worker_a.connect(alice)
+    await worker_b.connect(bob)
+    worker_a.subscribe(alice, 1)
+    worker_b.subscribe(bob, 1)
+
+    await worker_a.broadcast(1, "alice: привет")
+    await flush()
+
+    assert bob.sent == ["alice: привет"]
+    await close_all(worker_a)
+    await close_all(worker_b)
+
+
+@pytest.mark.asyncio
+async def test_postgres_backends_deliver_to_each_other(postgres_dsn):
+    channel = f"test_chat_{uuid.uuid4().hex}"
+    first, second = PostgresBackend(postgres_dsn, channel), PostgresBackend(postgres_dsn, channel)
+    received = {"first": asyncio.Queue(), "second": asyncio.Queue()}
+
+    async def on_first(chat_id, message):
+        await received["first"].put((chat_id, message))
+
+    async def on_second(chat_id, message):
+        await received["second"].put((chat_id, message))
+
+    await first.start(on_first)
+    await second.start(on_second)
+    try:
+        await first.publish(1, "привет")
+        await second.publish(2, '{"action": "message"}')
+
+        for queue in received.values():
+            got = {await asyncio.wait_for(queue.get(), 5) for _ in range(2)}
+            assert got == {(1, "привет"), (2, '{"action": "message"}')}
+    finally:
+        await first.stop()
+        await second.stop()
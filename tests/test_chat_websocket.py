@@ -0,0 +1,76 @@
+from types import SimpleNamespace
+
+import pytest
+from fastapi.testclient import TestClient
+
+from auth.helpers import create_access_token
+from database.database import engine, get_async_session
+from main import app
+from chat.manager import manager
+
+
+client = TestClient(app)
+
+
+def test_websocket_does_not_depend_on_request_session():
+    route = next(r for r in app.routes if getattr(r, 'path', None) == '/authenticated/chat/')
+    dependencies = [dep.call for dep in route.dependant.dependencies]
+    assert get_async_session not in dependencies
+
+
+@pytest.mark.asyncio
+async def test_idle_sockets_hold_no_pooled_connections(db_session):
+    '''каждый сокет делает запрос к бд (проверку доступа при subscribe), а затем простаивает'''
+    token = create_access_token(SimpleNamespace(username='alice'))
+
+    # один event loop на все сокеты, чтобы они делили пул engine
+    with TestClient(app) as pooled_client:
+        pooled_client.cookies.set('access_token', token)
+        sockets = [pooled_client.websocket_connect('/authenticated/chat/') for _ in range(10)]
+        try:
+            for ws in sockets:
+                ws.__enter__()
+                ws.send_json({"action": "subscribe", "chat_id": 1})
+                ws.receive_text()
+
+            assert len(manager.connections) == 10
+            assert engine.pool.checkedout() == 0
+        finally:
+            for ws in sockets:
+                ws.__exit__(None, None, None)
+            pooled_client.portal.call(engine.dispose)
+
+
+def test_bad_input_gets_error_frame_and_keeps_socket():
+    token = create_access_token(SimpleNamespace(username='alice'))
+    client.cookies.set('access_token', token)
+    try:
+        with client.websocket_connect('/authenticated/chat/') as ws:
+            ws.send_json({"action": "load_history", "chat_id": "abc"})
+            assert ws.receive_text() == "Ошибка: некорректный запрос."
+            ws.send_text("not json")
+            assert ws.receive_text() == "Ошибка: некорректный запрос."
+            assert len(manager.connections) == 1
+        assert manager.connections == {}
+    finally:
+        client.cookies.clear()
+
+
+def test_unexpected_error_still_releases_connection(monkeypatch):
+    def broken(*args):
+        raise RuntimeError("backend down")
+
+    monkeypatch.setattr(manager, 'is_subscribed', broken)
+    token = create_access_token(SimpleNamespace(username='alice'))
+    client.cookies.set('access_token', token)
+    try:
+        with client.websocket_connect('/authenticated/chat/') as ws:
+            ws.send_json({"action": "sync", "chat_id": 1})
+            try:
+                ws.receive_text()
+            except Exception:
+                pass
+        assert manager.connections == {}
+        assert manager.rooms == {}
+    finally:
+        client.cookies.clear()
@@ -0,0 +1,53 @@
+import pytest
+
+from import_data import batched, message_record, parse_datetime, parse_participants, read_rows, user_record
+
+from datetime import datetime, timedelta, timezone
+
+
+def test_read_rows_ndjson_and_csv(tmp_path):
+    ndjson = tmp_path / "chats.ndjson"
+    ndjson.write_text('{"id": 1, "participants": [1, 2]}\n\n{"id": 2, "participants": [2, 3]}\n', encoding="utf-8")
+    csv_file = tmp_path / "chats.csv"
+    csv_file.write_text("id,participants\n1,1;2\n2,2;3\n", encoding="utf-8")
+
+    from_json = list(read_rows(ndjson))
+    from_csv = list(read_rows(csv_file))
+
+    assert [parse_participants(row["participants"]) for row in from_json] == [[1, 2], [2, 3]]
+    assert [parse_participants(row["participants"]) for row in from_csv] == [[1, 2], [2, 3]]
+
+
+def test_records_are_typed_for_copy():
+    user = user_record({"id": "5", "username": "alice", "password": "hash", "active": "false"})
+    message = message_record({
+        "id": "7", "author_username": "alice", "content": "hi",
+        "sended_at": "2024-03-01T10:00:00+00:00", "chat_id": "3",
+    })
+
+    assert user[0] == 5 and user[2] is None and user[5] is False
+    assert message == (7, "alice", "hi", datetime(2024, 3, 1, 10, 0), 3)
+
+
+def test_message_without_sended_at_is_rejected_by_id():
+    row = {"id": "8", "author_username": "alice", "content": "hi", "sended_at": "", "chat_id": "3"}
+
+    with pytest.raises(ValueError, match="id=8"):
+        message_record(row)
+
+
+def test_missing_registered_at_defaults_to_utc_now():
+    user = user_record({"id": "5", "username": "alice", "password": "hash"})
+
+    assert user[4].tzinfo is None
+    assert abs(user[4] - datetime.now(timezone.utc).replace(tzinfo=None)) < timedelta(seconds=5)
+
+
+def test_aware_timestamps_are_converted_to_utc():
+    assert parse_datetime("2024-03-01T10:00:00+03:00") == datetime(2024, 3, 1, 7, 0)
+    assert parse_datetime("2024-03-01T10:00:00") == datetime(2024, 3, 1, 10, 0)
+    assert parse_datetime("") is None
+
+
+def test_batched_keeps_tail():
+    assert list(batched(range(5), 2)) == [[0, 1], [2, 3], [4]]
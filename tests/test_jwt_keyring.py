@@ -0,0 +1,92 @@
+import timeit
+
+import jwt
+import pytest
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec, ed25519, rsa
+
+from auth.utils import JWTKeyManager
+
+
+def write_key_pair(directory, name: str, private_key):
+    private_path = directory / f"{name}-private.pem"
+    public_path = directory / f"{name}-public.pem"
+    private_path.write_bytes(private_key.private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+    ))
+    public_path.write_bytes(private_key.public_key().public_bytes(
+        serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo
+    ))
+    return private_path, public_path
+
+
+GENERATORS = {
+    "RS256": lambda: rsa.generate_private_key(public_exponent=65537, key_size=2048),
+    "ES256": lambda: ec.generate_private_key(ec.SECP256R1()),
+    "EdDSA": ed25519.Ed25519PrivateKey.generate,
+}
+
+
+@pytest.fixture(scope="module")
+def keyrings(tmp_path_factory):
+    directory = tmp_path_factory.mktemp("keys")
+    return {
+        algorithm: JWTKeyManager(*write_key_pair(directory, algorithm, generate()), algorithm=None, previous_public_key_paths=[])
+        for algorithm, generate in GENERATORS.items()
+    }
+
+
+@pytest.mark.parametrize("algorithm", GENERATORS)
+def test_algorithm_is_detected_from_key(keyrings, algorithm):
+    keyring = keyrings[algorithm]
+    token = keyring.encode({"sub": "alice"})
+
+    header = jwt.get_unverified_header(token)
+    assert header["alg"] == algorithm
+    assert header["kid"] == keyring.signing_key.kid
+    assert keyring.decode(token)["sub"] == "alice"
+
+
+def test_rotation_keeps_old_tokens_valid(tmp_path):
+    old_private, old_public = write_key_pair(tmp_path, "old", GENERATORS["EdDSA"]())
+    new_private, new_public = write_key_pair(tmp_path, "new", GENERATORS["EdDSA"]())
+    old_keyring = JWTKeyManager(old_private, old_public, None, [])
+    rotated = JWTKeyManager(new_private, new_public, None, [old_public])
+
+    old_token = old_keyring.encode({"sub": "alice"})
+    # токен, выданный до появления kid в заголовке
+    legacy_token = jwt.encode({"sub": "bob"}, old_keyring.private_key, algorithm="EdDSA")
+
+    assert rotated.decode(old_token)["sub"] == "alice"
+    assert rotated.decode(legacy_token)["sub"] == "bob"
+    assert jwt.get_unverified_header(rotated.encode({"sub": "carol"}))["kid"] == rotated.signing_key.kid
+
+    dropped = JWTKeyManager(new_private, new_public, None, [])
+    with pytest.raises(jwt.InvalidTokenError):
+        dropped.decode(old_token)
+    with pytest.raises(jwt.InvalidTokenError):
+        dropped.decode(legacy_token)
+
+
+def test_token_algorithm_cannot_override_key_algorithm(keyrings):
+    rsa_keyring = keyrings["RS256"]
+    forged = jwt.encode(
+        {"sub": "mallory"}, "secret", algorithm="HS256", headers={"kid": rsa_keyring.signing_key.kid}
+    )
+
+    with pytest.raises(jwt.InvalidTokenError):
+        rsa_keyring.decode(forged)
+
+
+@pytest.mark.benchmark
+def test_issue_and_verify_throughput_by_algorithm(keyrings):
+    results = {}
+    for algorithm, keyring in keyrings.items():
+        token = keyring.encode({"sub": "alice"})
+        issue = min(timeit.repeat(lambda: keyring.encode({"sub": "alice"}), number=50, repeat=3)) / 50
+        verify = min(timeit.repeat(lambda: keyring.decode(token), number=50, repeat=3)) / 50
+        results[algorithm] = (issue, verify)
+
+    # подпись RSA на порядок дороже, чем у эллиптических кривых
+    assert results["EdDSA"][0] < results["RS256"][0]
+    assert results["ES256"][0] < results["RS256"][0]
@@ -0,0 +1,51 @@
+import timeit
+
+import jwt
+import pytest
+from cryptography.hazmat.primitives.asymmetric.types import PrivateKeyTypes, PublicKeyTypes
+
+from auth.utils import decode_jwt, encode_jwt, key_manager
+from config import settings
+
+
+PRIVATE_PEM = settings.auth_jwt.private_key_path.read_text()
+PUBLIC_PEM = settings.auth_jwt.public_key_path.read_text()
+
+
+def per_call(func, number: int) -> float:
+    '''лучшее из нескольких прогонов, в секундах на вызов'''
+    return min(timeit.repeat(func, number=number, repeat=5)) / number
+
+
+def test_tokens_roundtrip_with_parsed_keys():
+    token = encode_jwt({"sub": "alice"})
+
+    assert decode_jwt(token)["sub"] == "alice"
+    # выданные раньше токены и PEM-ключи по-прежнему совместимы
+    assert jwt.decode(token, PUBLIC_PEM, algorithms=[key_manager.algorithm])["sub"] == "alice"
+    assert decode_jwt(encode_jwt({"sub": "bob"}, private_key=PRIVATE_PEM), public_key=PUBLIC_PEM)["sub"] == "bob"
+
+
+def test_keys_are_parsed_once():
+    assert isinstance(key_manager.private_key, PrivateKeyTypes)
+    assert isinstance(key_manager.public_key, PublicKeyTypes)
+
+
+@pytest.mark.benchmark
+def test_parsed_private_key_speeds_up_token_issue():
+    '''выдача токенов: /jwt/login/ и /jwt/refresh/'''
+    pem = per_call(lambda: encode_jwt({"sub": "alice"}, private_key=PRIVATE_PEM), number=5)
+    parsed = per_call(lambda: encode_jwt({"sub": "alice"}), number=5)
+
+    assert parsed * 5 < pem
+
+
+@pytest.mark.benchmark
+def test_parsed_public_key_speeds_up_token_check():
+    '''проверка токена на каждом авторизованном запросе'''
+    token = encode_jwt({"sub": "alice"})
+
+    pem = per_call(lambda: decode_jwt(token, public_key=PUBLIC_PEM), number=200)
+    parsed = per_call(lambda: decode_jwt(token, public_key=key_manager.public_key), number=200)
+
+    assert parsed < pem
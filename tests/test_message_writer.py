@@ -0,0 +1,128 @@
+import asyncio
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+
+from chat.writer import MessageWriter
+
+
+class RecordingSession:
+    def __init__(self, log: list, updates: list | None = None):
+        self.log = log
+        self.updates = updates if updates is not None else []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        pass
+
+    async def execute(self, statement, params):
+        if not statement.is_insert:
+            self.updates.append(params)
+            return None
+        self.log.append(params)
+        start = sum(len(batch) for batch in self.log[:-1])
+        return SimpleNamespace(all=lambda: [
+            SimpleNamespace(id=start + i + 1, sended_at=datetime(2024, 1, 1)) for i in range(len(params))
+        ])
+
+    async def commit(self):
+        pass
+
+
+@pytest.mark.asyncio
+async def test_concurrent_writes_are_grouped_into_one_insert():
+    batches = []
+    writer = MessageWriter(session_maker=lambda: RecordingSession(batches), batch_size=200, flush_interval_ms=10)
+
+    messages = await asyncio.gather(*(
+        writer.write(author_username="alice", chat_id=1, content=f"msg {i}") for i in range(50)
+    ))
+    await writer.stop()
+
+    assert len(batches) == 1
+    assert [m.id for m in messages] == list(range(1, 51))
+    assert messages[7].content == "msg 7"
+
+
+@pytest.mark.asyncio
+async def test_batch_is_split_by_size():
+    batches = []
+    writer = MessageWriter(session_maker=lambda: RecordingSession(batches), batch_size=20, flush_interval_ms=10)
+
+    await asyncio.gather(*(writer.write(author_username="alice", chat_id=1, content="hi") for i in range(50)))
+    await writer.stop()
+
+    assert [len(batch) for batch in batches] == [20, 20, 10]
+
+
+@pytest.mark.asyncio
+async def test_chat_summary_is_updated_with_the_batch():
+    batches, updates = [], []
+    writer = MessageWriter(session_maker=lambda: RecordingSession(batches, updates), batch_size=200, flush_interval_ms=10)
+
+    await asyncio.gather(*(
+        writer.write(author_username="alice", chat_id=i % 2, content=f"msg {i}" * 50) for i in range(10)
+    ))
+    await writer.stop()
+
+    summary, participants = updates
+    assert summary == participants
+    assert {s["summary_chat_id"]: s["summary_message_id"] for s in summary} == {0: 9, 1: 10}
+    assert all(len(s["summary_preview"]) == 100 for s in summary)
+
+
+@pytest.mark.asyncio
+async def test_chat_summaries_are_updated_in_chat_id_order():
+    batches, updates = [], []
+    writer = MessageWriter(session_maker=lambda: RecordingSession(batches, updates), batch_size=200, flush_interval_ms=10)
+
+    await asyncio.gather(*(writer.write(author_username="alice", chat_id=chat_id, content="hi") for chat_id in (5, 3, 9, 3)))
+    await writer.stop()
+
+    summary, participants = updates
+    assert [s["summary_chat_id"] for s in summary] == [3, 5, 9]
+    assert [s["summary_chat_id"] for s in participants] == [3, 5, 9]
+
+
+class BlockingSession(RecordingSession):
+    def __init__(self, log: list, started: asyncio.Event, release: asyncio.Event):
+        super().__init__(log)
+        self.started = started
+        self.release = release
+
+    async def execute(self, statement, params):
+        self.started.set()
+        await self.release.wait()
+        return await super().execute(statement, params)
+
+
+@pytest.mark.asyncio
+async def test_stop_finishes_batch_in_flight():
+    batches, started, release = [], asyncio.Event(), asyncio.Event()
+    writer = MessageWriter(session_maker=lambda: BlockingSession(batches, started, release), batch_size=1, flush_interval_ms=10)
+
+    pending = asyncio.ensure_future(writer.write(author_username="alice", chat_id=1, content="hi"))
+    await started.wait()
+    stopping = asyncio.ensure_future(writer.stop())
+    await asyncio.sleep(0.01)
+    release.set()
+    await asyncio.wait_for(stopping, 1)
+
+    message = await asyncio.wait_for(pending, 1)
+    assert message.id == 1
+
+
+@pytest.mark.asyncio
+async def test_stop_flushes_batch_still_being_collected():
+    batches = []
+    writer = MessageWriter(session_maker=lambda: RecordingSession(batches), batch_size=200, flush_interval_ms=10_000)
+
+    pending = asyncio.ensure_future(writer.write(author_username="alice", chat_id=1, content="hi"))
+    await asyncio.sleep(0.01)
+    await asyncio.wait_for(writer.stop(), 1)
+
+    assert (await asyncio.wait_for(pending, 1)).content == "hi"
+    assert len(batches) == 1
@@ -0,0 +1,180 @@
+import asyncio
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from auth.utils import PasswordHasher, PasswordHasherBusy, hash_password
+
+
+async def measure_loop_lag(stop: asyncio.Event, interval: float = 0.005) -> float:
+    '''максимальная задержка пробуждения тикера - столько ждал бы любой вебсокет на этом воркере'''
+    worst = 0.0
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        worst = max(worst, time.perf_counter() - started - interval)
+    return worst
+
+
+async def login_storm(check, logins: int) -> float:
+    stop = asyncio.Event()
+    ticker = asyncio.create_task(measure_loop_lag(stop))
+    await asyncio.sleep(0)
+    await asyncio.gather(*(check() for _ in range(logins)))
+    stop.set()
+    return await ticker
+
+
+@pytest.mark.asyncio
+async def test_hashing_runs_outside_event_loop_thread():
+    hasher = PasswordHasher(workers=1, queue_size=0)
+
+    thread_name = await hasher.run(lambda: threading.current_thread().name)
+    hasher.executor.shutdown()
+
+    assert thread_name.startswith("password-hasher")
+    assert thread_name != threading.current_thread().name
+
+
+@pytest.mark.benchmark
+@pytest.mark.asyncio
+async def test_login_storm_does_not_block_event_loop():
+    hashed = hash_password("secret")
+    hasher = PasswordHasher(workers=4, queue_size=16)
+
+    async def blocking_check():
+        from auth.utils import validate_password
+        assert validate_password("secret", hashed)
+
+    async def offloaded_check():
+        assert await hasher.validate("secret", hashed)
+
+    blocking_lag = await login_storm(blocking_check, 4)
+    offloaded_lag = await login_storm(offloaded_check, 4)
+    hasher.executor.shutdown()
+
+    assert offloaded_lag < 0.05
+    assert offloaded_lag < blocking_lag / 4
+
+
+@pytest.mark.asyncio
+async def test_saturated_hasher_rejects_instead_of_queueing():
+    hasher = PasswordHasher(workers=1, queue_size=1)
+
+    results = await asyncio.gather(*(hasher.hash("secret") for _ in range(3)), return_exceptions=True)
+    hasher.executor.shutdown()
+
+    assert sum(isinstance(result, bytes) for result in results) == 2
+    assert sum(isinstance(result, PasswordHasherBusy) for result in results) == 1
+    assert hasher.pending == 0
+
+
+def test_register_returns_503_when_hasher_is_saturated(monkeypatch):
+    from fastapi.testclient import TestClient
+
+    import auth.utils
+    from main import app
+
+    monkeypatch.setattr(auth.utils.password_hasher, "max_pending", 0)
+
+    response = TestClient(app).post('/register', data={'username': 'storm', 'password': 'secret'})
+
+    assert response.status_code == 503
+    assert response.headers['retry-after'] == '1'
+
+
+class LoginSession:
+    def __init__(self, user):
+        self.user = user
+        self.commits = 0
+
+    async def execute(self, statement):
+        return SimpleNamespace(scalars=lambda: SimpleNamespace(first=lambda: self.user))
+
+    async def commit(self):
+        self.commits += 1
+
+
+def test_rehash_is_needed_when_cost_changes(monkeypatch):
+    from auth.utils import password_needs_rehash
+    from config import settings
+
+    monkeypatch.setattr(settings.password, "bcrypt_rounds", 4)
+    hashed = hash_password("secret")
+
+    assert hashed.startswith(b"$2b$04$")
+    assert not password_needs_rehash(hashed)
+
+    monkeypatch.setattr(settings.password, "bcrypt_rounds", 5)
+    assert password_needs_rehash(hashed)
+
+
+@pytest.mark.asyncio
+async def test_login_rehashes_password_with_current_policy(monkeypatch):
+    from auth.utils import validate_password
+    from auth.validation import validate_auth_user_db
+    from config import settings
+
+    monkeypatch.setattr(settings.password, "bcrypt_rounds", 4)
+    user = SimpleNamespace(username="alice", password=hash_password("secret").decode(), email=None, active=True)
+    session = LoginSession(user)
+
+    await validate_auth_user_db("alice", "secret", session)
+    assert session.commits == 0
+
+    monkeypatch.setattr(settings.password, "bcrypt_rounds", 5)
+    await validate_auth_user_db("alice", "secret", session)
+
+    assert session.commits == 1
+    assert user.password.startswith("$2b$05$")
+    assert validate_password("secret", user.password.encode())
+
+
+def test_argon2id_hash_verify_and_rehash(monkeypatch):
+    pytest.importorskip("argon2")
+    from auth.utils import password_needs_rehash, validate_password
+    from config import settings
+
+    monkeypatch.setattr(settings.password, "scheme", "argon2id")
+    monkeypatch.setattr(settings.password, "argon2_time_cost", 1)
+    monkeypatch.setattr(settings.password, "argon2_memory_cost", 1024)
+    monkeypatch.setattr(settings.password, "bcrypt_rounds", 4)
+    hashed = hash_password("secret")
+
+    assert hashed.startswith(b"$argon2id$")
+    assert validate_password("secret", hashed)
+    assert not validate_password("wrong", hashed)
+    assert not password_needs_rehash(hashed)
+
+    monkeypatch.setattr(settings.password, "argon2_time_cost", 2)
+    assert password_needs_rehash(hashed)
+
+    # старые bcrypt-хэши переводятся на argon2id, и наоборот
+    monkeypatch.setattr(settings.password, "scheme", "bcrypt")
+    bcrypt_hashed = hash_password("secret")
+    assert password_needs_rehash(hashed)
+    monkeypatch.setattr(settings.password, "scheme", "argon2id")
+    assert password_needs_rehash(bcrypt_hashed)
+    assert validate_password("secret", bcrypt_hashed)
+
+
+def test_argon2id_scheme_fails_at_startup_without_argon2(monkeypatch):
+    import builtins
+
+    from auth.utils import check_password_scheme
+    from config import settings
+
+    real_import = builtins.__import__
+
+    def import_without_argon2(name, *args, **kwargs):
+        if name == "argon2":
+            raise ImportError(name)
+        return real_import(name, *args, **kwargs)
+
+    monkeypatch.setattr(settings.password, "scheme", "argon2id")
+    monkeypatch.setattr(builtins, "__import__", import_without_argon2)
+
+    with pytest.raises(RuntimeError, match="argon2-cffi"):
+        check_password_scheme()
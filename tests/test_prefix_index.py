@@ -0,0 +1,50 @@
+import asyncio
+
+import pytest
+
+from search.prefix_index import UsernamePrefixIndex
+
+
+def test_prefix_search_is_case_insensitive_and_sorted():
+    index = UsernamePrefixIndex()
+    index.build(["bobby", "Alice", "bob", "alex", "Bo"])
+
+    assert index.search("bo") == ["Bo", "bob", "bobby"]
+    assert index.search("AL") == ["alex", "Alice"]
+    assert index.search("z") == []
+    assert index.search("") == []
+
+
+def test_add_keeps_order_and_ignores_duplicates():
+    index = UsernamePrefixIndex()
+    index.build(["bob", "bobby"])
+
+    index.add("boba")
+    index.add("bob")
+
+    assert len(index) == 3
+    assert index.search("bob", limit=2) == ["bob", "boba"]
+
+
+def test_lowercase_names_share_key_strings():
+    index = UsernamePrefixIndex()
+    index.build([f"user{i}" for i in range(1000)])
+    mixed = UsernamePrefixIndex()
+    mixed.build([f"User{i}" for i in range(1000)])
+
+    assert index.memory_usage() < mixed.memory_usage()
+
+
+@pytest.mark.asyncio
+async def test_index_is_rebuilt_periodically(monkeypatch):
+    from search import prefix_index
+
+    rebuilt = asyncio.Event()
+
+    async def warm():
+        rebuilt.set()
+
+    monkeypatch.setattr(prefix_index, "warm_username_index", warm)
+    refresh = asyncio.create_task(prefix_index.run_username_index_refresh(interval=0))
+    await asyncio.wait_for(rebuilt.wait(), timeout=1)
+    refresh.cancel()
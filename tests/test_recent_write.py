@@ -0,0 +1,50 @@
+from types import SimpleNamespace
+import time
+
+from auth import recent_write
+from auth.helpers import create_access_token
+from auth.recent_write import has_recent_write_token, mark_recent_write, read_session_maker_for
+from database.database import async_read_session_maker, async_session_maker
+
+
+def test_recent_writer_reads_from_primary():
+    assert read_session_maker_for("reader") is async_read_session_maker
+    assert read_session_maker_for(None) is async_read_session_maker
+
+    mark_recent_write("writer")
+
+    assert read_session_maker_for("writer") is async_session_maker
+    assert read_session_maker_for("reader") is async_read_session_maker
+
+
+def test_recent_write_window_is_visible_to_other_workers():
+    token = mark_recent_write("cookie_writer")
+    # другой воркер: локальной отметки у него нет, есть только кука
+    recent_write._recent_writes.clear()
+
+    assert read_session_maker_for("cookie_writer", token) is async_session_maker
+    assert read_session_maker_for("someone_else", token) is async_read_session_maker
+    assert read_session_maker_for("cookie_writer", None) is async_read_session_maker
+    access_token = create_access_token(SimpleNamespace(username="cookie_writer"))
+    assert read_session_maker_for("cookie_writer", access_token) is async_read_session_maker
+
+
+def test_recent_write_marker_rejects_expired_and_forged_values(monkeypatch):
+    token = mark_recent_write("writer")
+    expires, _, signature = token.partition(".")
+
+    assert has_recent_write_token("writer", token)
+    assert not has_recent_write_token("writer", f"{int(expires) + 60000}.{signature}")
+    assert not has_recent_write_token("writer", "garbage")
+
+    monkeypatch.setattr(time, "time", lambda: int(expires) / 1000 + 1)
+    assert not has_recent_write_token("writer", token)
+
+
+def test_mark_recent_write_does_not_sign_jwt(monkeypatch):
+    def fail(*args, **kwargs):
+        raise AssertionError("jwt подписывается на каждую запись")
+
+    monkeypatch.setattr(recent_write.key_manager, "encode", fail)
+
+    assert has_recent_write_token("writer", mark_recent_write("writer"))
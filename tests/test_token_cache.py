@@ -0,0 +1,76 @@
+import time
+import timeit
+from datetime import timedelta
+
+import jwt
+import pytest
+
+from auth.utils import VerifiedTokenCache, decode_jwt, decode_jwt_ws, encode_jwt, key_manager, verified_token_cache
+
+
+@pytest.fixture
+def cache():
+    verified_token_cache.clear()
+    verified_token_cache.hits = verified_token_cache.misses = 0
+    yield verified_token_cache
+    verified_token_cache.clear()
+
+
+def test_repeated_decode_is_served_from_cache(cache):
+    token = encode_jwt({"sub": "alice"})
+
+    first = decode_jwt(token)
+    second = decode_jwt_ws(token)
+
+    assert first == second
+    assert cache.stats() == {"size": 1, "max_size": cache.max_size, "hits": 1, "misses": 1}
+
+
+def test_cached_payload_is_a_copy(cache):
+    token = encode_jwt({"sub": "alice"})
+
+    decode_jwt(token)["sub"] = "mallory"
+
+    assert decode_jwt(token)["sub"] == "alice"
+
+
+def test_entry_expires_with_token(cache):
+    token = encode_jwt({"sub": "alice"}, expire_timedelta=timedelta(seconds=1))
+    decode_jwt(token)
+
+    time.sleep(1.1)
+
+    with pytest.raises(jwt.ExpiredSignatureError):
+        decode_jwt(token)
+    assert cache.stats()["size"] == 0
+
+
+def test_invalid_and_foreign_key_tokens_are_not_cached(cache):
+    with pytest.raises(jwt.InvalidTokenError):
+        decode_jwt("not-a-token")
+    decode_jwt(encode_jwt({"sub": "alice"}), public_key=key_manager.public_key)
+
+    assert cache.stats()["size"] == 0
+
+
+def test_least_recently_used_token_is_evicted():
+    cache = VerifiedTokenCache(max_size=2)
+    exp = time.time() + 60
+    cache.put("a", {"exp": exp})
+    cache.put("b", {"exp": exp})
+    cache.get("a")
+    cache.put("c", {"exp": exp})
+
+    assert cache.get("b") is None
+    assert cache.get("a") is not None and cache.get("c") is not None
+
+
+@pytest.mark.benchmark
+def test_cache_hit_is_faster_than_signature_check(cache):
+    token = encode_jwt({"sub": "alice"})
+    decode_jwt(token)
+
+    verify = min(timeit.repeat(lambda: decode_jwt(token, public_key=key_manager.public_key), number=200, repeat=5))
+    cached = min(timeit.repeat(lambda: decode_jwt(token), number=200, repeat=5))
+
+    assert cached * 5 < verify